@@ -0,0 +1,17 @@
+from django.utils.functional import SimpleLazyObject
+
+from posts.models import Mention
+
+
+def mentions(request):
+    """Число непросмотренных упоминаний; считается, только если
+    шаблон его выводит."""
+    def unseen():
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return 0
+        return Mention.objects.filter(user=user, is_seen=False).count()
+
+    return {
+        'unseen_mentions': SimpleLazyObject(unseen)
+    }
@@ -0,0 +1,56 @@
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.template.defaultfilters import date, truncatechars
+from django.templatetags.static import static
+from django.urls import reverse
+from jinja2 import Environment
+from markupsafe import Markup
+from sorl.thumbnail import get_thumbnail
+
+from core.templatetags.user_filters import addclass, linkify
+
+
+def url(viewname, *args, **kwargs):
+    return reverse(viewname, args=args or None, kwargs=kwargs or None)
+
+
+def thumbnail(file_, geometry, **options):
+    """Аналог {% thumbnail %}: миниатюра или None, если картинки нет."""
+    if not file_:
+        return None
+    try:
+        return get_thumbnail(file_, geometry, **options)
+    except Exception:
+        # Как и тег sorl, битая картинка не роняет страницу.
+        return None
+
+
+def cache(timeout, fragment_name, *vary_on, caller):
+    """Аналог {% cache %} с тем же ключом фрагмента, что и в DTL."""
+    try:
+        fragment_cache = caches['template_fragments']
+    except InvalidCacheBackendError:
+        fragment_cache = caches['default']
+    key = make_template_fragment_key(fragment_name, vary_on)
+    value = fragment_cache.get(key)
+    if value is None:
+        value = caller()
+        fragment_cache.set(key, value, timeout)
+    return Markup(value)
+
+
+def environment(**options):
+    env = Environment(**options)
+    env.globals.update({
+        'url': url,
+        'static': static,
+        'thumbnail': thumbnail,
+        'cache': cache,
+    })
+    env.filters.update({
+        'addclass': addclass,
+        'date': date,
+        'linkify': linkify,
+        'truncatechars': truncatechars,
+    })
+    return env
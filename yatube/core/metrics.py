@@ -0,0 +1,322 @@
+"""Метрики в текстовом формате Prometheus.
+
+Значения копятся в памяти процесса. Если задан METRICS_DIR, каждый
+процесс периодически сохраняет свои значения в файл <pid>.json в этом
+каталоге, а /metrics суммирует файлы всех процессов. Каталог стоит
+очищать при деплое, иначе счётчики давно остановленных процессов
+так и будут входить в сумму (для Prometheus это выглядит как сброс
+счётчиков при следующей очистке, что rate() переживает).
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.urls import Resolver404, resolve
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.values = {}
+        self.flushed_at = 0
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def update(self, metric, labels, update):
+        labels = tuple(sorted(
+            (name, str(value)) for name, value in labels.items()
+        ))
+        key = (metric.name, labels)
+        with self.lock:
+            if self.pid != os.getpid():
+                # Процесс создан fork(): значения родителя уже учтены.
+                self.reset()
+            self.values[key] = update(self.values.get(key))
+
+    def snapshot(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            return [
+                [name, list(labels), value]
+                for (name, labels), value in self.values.items()
+            ]
+
+    def flush(self, force=False):
+        """Сохраняет значения процесса в METRICS_DIR, не чаще раза
+        в METRICS_FLUSH_INTERVAL секунд."""
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or (
+            not force
+            and now - self.flushed_at < settings.METRICS_FLUSH_INTERVAL
+        ):
+            return
+        self.flushed_at = now
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        os.makedirs(directory, exist_ok=True)
+        with open(temporary, 'w') as output:
+            json.dump(self.snapshot(), output)
+        os.replace(temporary, path)
+
+    def collect(self):
+        """Суммирует значения всех процессов: {(имя, метки): значение}."""
+        directory = settings.METRICS_DIR
+        if not directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush(force=True)
+            snapshots = []
+            for name in os.listdir(directory):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(directory, name)) as source:
+                        snapshots.append(json.load(source))
+                except (OSError, ValueError):
+                    continue
+        totals = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot:
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                key = (name, tuple(tuple(label) for label in labels))
+                totals[key] = metric.merge(totals.get(key), value)
+        return totals
+
+    def render(self):
+        totals = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            if isinstance(metric, Gauge):
+                samples = metric.samples()
+            else:
+                samples = [
+                    (dict(labels), value)
+                    for (key, labels), value in sorted(totals.items())
+                    if key == name
+                ]
+            for labels, value in samples:
+                lines.extend(metric.format(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+                '\n', r'\n'
+            ),
+        )
+        for key, value in sorted(labels.items())
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        REGISTRY.register(self)
+
+    def merge(self, total, value):
+        return value if total is None else total + value
+
+    def format(self, labels, value):
+        labels = _format_labels(labels)
+        return [f'{self.name}{labels} {_format_value(value)}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        REGISTRY.update(self, labels, lambda value: (value or 0) + amount)
+
+
+class Histogram(Metric):
+    """Гистограмма: число наблюдений по корзинам, сумма и количество."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, amount, **labels):
+        index = bisect_left(self.buckets, amount)
+
+        def update(value):
+            value = value or [0] * (len(self.buckets) + 1) + [0.0]
+            value[index] += 1
+            value[-1] += amount
+            return value
+
+        REGISTRY.update(self, labels, update)
+
+    def merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def format(self, labels, value):
+        lines = []
+        cumulative = 0
+        for bound, observed in zip(
+            self.buckets + (float('inf'),), value[:-1]
+        ):
+            cumulative += observed
+            lines.append(
+                f'{self.name}_bucket'
+                f'{_format_labels({**labels, "le": _format_value(bound)})} '
+                f'{cumulative}'
+            )
+        labels = _format_labels(labels)
+        lines.append(f'{self.name}_sum{labels} {value[-1]}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Gauge(Metric):
+    """Значение, которое вычисляется в момент запроса /metrics.
+
+    collect() возвращает пары (метки, значение); так считаются,
+    например, длины очередей по таблицам, общие для всех процессов.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, collect):
+        super().__init__(name, documentation)
+        self.collect = collect
+
+    def samples(self):
+        return list(self.collect())
+
+
+VIEW_DURATION = Histogram(
+    'yatube_view_duration_seconds',
+    'Время ответа по представлениям.'
+)
+RESPONSES = Counter(
+    'yatube_responses_total',
+    'Ответы по представлениям и кодам.'
+)
+DB_QUERIES = Counter(
+    'yatube_db_queries_total',
+    'Запросы к БД по представлениям.'
+)
+DB_DURATION = Counter(
+    'yatube_db_query_seconds_total',
+    'Суммарное время запросов к БД по представлениям.'
+)
+CACHE_REQUESTS = Counter(
+    'yatube_cache_requests_total',
+    'Чтения из кешей: попадания (hit) и промахи (miss).'
+)
+
+
+def view_name(request):
+    match = request.resolver_match
+    if match is None:
+        # Ответ из кеша страниц: представление не вызывалось.
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return '<unresolved>'
+    return match.view_name
+
+
+class MetricsMiddleware:
+    """Время ответа и запросы к БД по представлениям.
+
+    Стоит первым, чтобы учитывать и страницы из кеша страниц.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        queries = {'count': 0, 'seconds': 0.0}
+
+        def count_query(execute, sql, params, many, context):
+            query_started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries['count'] += 1
+                queries['seconds'] += time.perf_counter() - query_started
+
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        view = view_name(request)
+        VIEW_DURATION.observe(
+            time.perf_counter() - started, view=view, method=request.method
+        )
+        RESPONSES.inc(view=view, status=response.status_code)
+        if queries['count']:
+            DB_QUERIES.inc(queries['count'], view=view)
+            DB_DURATION.inc(queries['seconds'], view=view)
+        REGISTRY.flush()
+        return response
+
+
+class MeteredLocMemCache(LocMemCache):
+    """LocMemCache, который считает попадания; метка — LOCATION.
+
+    get_many() у LocMemCache сводится к get(), так что считается тоже.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.location = name or 'default'
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self, version)
+        CACHE_REQUESTS.inc(
+            cache=self.location, result='miss' if value is self else 'hit'
+        )
+        return default if value is self else value
+
+
+def _flush_at_exit():
+    try:
+        REGISTRY.flush(force=True)
+    except OSError:
+        pass
+
+
+atexit.register(_flush_at_exit)
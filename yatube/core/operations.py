@@ -0,0 +1,88 @@
+from django.db import migrations
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """AddIndex, который в PostgreSQL строит индекс без блокировки записи.
+
+    Миграция с этой операцией должна быть объявлена с atomic = False.
+    На остальных СУБД работает как обычный AddIndex.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        sql = str(self.index.create_sql(model, schema_editor))
+        schema_editor.execute(
+            sql.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        schema_editor.execute(
+            'DROP INDEX CONCURRENTLY IF EXISTS %s'
+            % schema_editor.quote_name(self.index.name)
+        )
+
+    def describe(self):
+        return 'Concurrently create index %s on field(s) %s of model %s' % (
+            self.index.name,
+            ', '.join(self.index.fields),
+            self.model_name,
+        )
+
+
+class RemoveIndexConcurrently(migrations.RemoveIndex):
+    """RemoveIndex, который в PostgreSQL удаляет индекс без блокировки записи.
+
+    Миграция с этой операцией должна быть объявлена с atomic = False.
+    На остальных СУБД работает как обычный RemoveIndex.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        schema_editor.execute(
+            'DROP INDEX CONCURRENTLY IF EXISTS %s'
+            % schema_editor.quote_name(self.name)
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        index = to_state.models[
+            app_label, self.model_name_lower
+        ].get_index_by_name(self.name)
+        sql = str(index.create_sql(model, schema_editor))
+        schema_editor.execute(
+            sql.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+        )
+
+    def describe(self):
+        return 'Concurrently remove index %s from %s' % (
+            self.name, self.model_name
+        )
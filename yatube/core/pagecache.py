@@ -0,0 +1,142 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import Signal
+
+from .metrics import CACHE_REQUESTS
+
+_state = threading.local()
+
+# Отправляется, когда страница отдана из кеша и представление не вызывалось.
+page_served = Signal(providing_args=['request'])
+
+
+def tag_for(instance):
+    return f'{instance._meta.label_lower}:{instance.pk}'
+
+
+def add_tags(*tags):
+    """Добавляет зависимости страницы, которая сейчас отрисовывается."""
+    tags_in_progress = getattr(_state, 'tags', None)
+    if tags_in_progress is not None:
+        tags_in_progress.update(tags)
+
+
+def track(sender, instance, **kwargs):
+    """Обработчик post_init: страница зависит от каждого загруженного
+    объекта отслеживаемых моделей."""
+    if instance.pk is not None:
+        add_tags(tag_for(instance))
+
+
+def _version_key(tag):
+    return f'pagecache:tag:{tag}'
+
+
+def _add_versions(cache, tags):
+    """Заводит недостающие версии тегов.
+
+    Начальная версия — текущее время в наносекундах, а не 1: если кеш
+    вытеснит версию тега и её заведут заново, она не совпадёт с
+    версией, записанной в страницы до сброса, и они не оживут.
+    """
+    for tag in tags:
+        cache.add(_version_key(tag), time.time_ns(), None)
+
+
+def _bump(tags):
+    cache = caches[settings.PAGECACHE_CACHE]
+    for tag in tags:
+        try:
+            cache.incr(_version_key(tag))
+        except ValueError:
+            _add_versions(cache, [tag])
+
+
+def purge(*tags):
+    """Сбрасывает все страницы, зависящие от любого из тегов.
+
+    Версии тегов увеличиваются сразу и ещё раз после коммита: иначе
+    запрос, прочитавший старые данные до коммита, успел бы сохранить
+    страницу уже с новой версией тега.
+
+    Сброс виден всем процессам, только если PAGECACHE_CACHE общий
+    (memcached). С LocMemCache у каждого процесса свой кеш страниц,
+    и purge() сбрасывает страницы лишь того процесса, где вызван.
+    """
+    tags = {tag for tag in tags if tag}
+    if not tags:
+        return
+    _bump(tags)
+    transaction.on_commit(lambda: _bump(tags))
+
+
+class PageCacheMiddleware:
+    """Кеширует целые страницы для анонимных посетителей.
+
+    Вместе с ответом хранятся версии тегов объектов, загруженных при
+    отрисовке (см. track и add_tags). purge() увеличивает версию тега,
+    и зависящие от него страницы перестают считаться актуальными.
+    Анонимным считается запрос без cookie сессии, поэтому при попадании
+    в кеш сессия, пользователь и представление не загружаются совсем.
+
+    Кеш должен быть общим для всех процессов сервера (см. CACHES
+    в настройках), иначе правка в одном процессе не сбросит страницы,
+    сохранённые другими.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.is_cacheable_request(request):
+            return self.get_response(request)
+        cache = caches[settings.PAGECACHE_CACHE]
+        key = 'pagecache:page:' + hashlib.md5(
+            request.build_absolute_uri().encode()
+        ).hexdigest()
+        entry = cache.get(key)
+        if entry is not None:
+            response, versions = entry
+            current = cache.get_many([_version_key(tag) for tag in versions])
+            if all(
+                current.get(_version_key(tag)) == version
+                for tag, version in versions.items()
+            ):
+                CACHE_REQUESTS.inc(cache='pages', result='hit')
+                page_served.send(sender=self.__class__, request=request)
+                return response
+        CACHE_REQUESTS.inc(cache='pages', result='miss')
+        _state.tags = set()
+        try:
+            response = self.get_response(request)
+            tags = _state.tags
+        finally:
+            _state.tags = None
+        if self.is_cacheable_response(request, response):
+            _add_versions(cache, tags)
+            current = cache.get_many([_version_key(tag) for tag in tags])
+            versions = {
+                tag: current.get(_version_key(tag)) for tag in tags
+            }
+            cache.set(key, (response, versions), settings.PAGECACHE_TIMEOUT)
+        return response
+
+    def is_cacheable_request(self, request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        )
+
+    def is_cacheable_response(self, request, response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not request.META.get('CSRF_COOKIE_USED')
+            and 'private' not in response.get('Cache-Control', '')
+        )
@@ -0,0 +1,247 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+class QuerySetChain:
+    """Несколько QuerySet, которые постранично читаются как один список.
+
+    Срез сначала берётся из первого набора, недостающие строки добираются
+    из следующих. COUNT по набору выполняется только тогда, когда срез
+    целиком лежит за его пределами.
+    """
+
+    def __init__(self, *querysets):
+        self.querysets = querysets
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        offset = key.start or 0
+        limit = None if key.stop is None else key.stop - offset
+        result = []
+        for queryset in self.querysets:
+            if limit is not None and limit <= 0:
+                break
+            chunk = list(queryset[
+                offset:None if limit is None else offset + limit
+            ])
+            if chunk:
+                result.extend(chunk)
+                offset = 0
+                if limit is not None:
+                    limit -= len(chunk)
+            else:
+                offset = max(offset - queryset.count(), 0)
+        return result
+
+
+class QuerySetMerge:
+    """Несколько лент, которые KeysetPaginator сливает в одну без повторов.
+
+    Каждая лента читается по своему индексу в порядке курсора: порции
+    лент собираются одним запросом UNION ALL вместо запроса с OR, для
+    которого индекс по дате уже не подходит. Отобранные строки
+    загружаются одним запросом из base.
+    """
+
+    def __init__(self, *querysets, base):
+        self.querysets = querysets
+        self.base = base
+
+
+class EstimatedPage(Page):
+    def has_next(self):
+        if self.paginator.is_estimated:
+            return len(self) == self.paginator.per_page
+        return super().has_next()
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator, который не считает COUNT(*) по большим таблицам.
+
+    Сначала строки считаются точно, но не дальше порога
+    PAGINATOR_COUNT_THRESHOLD (COUNT по подзапросу с LIMIT). Только если
+    порог достигнут, берётся оценка планировщика PostgreSQL:
+    pg_class.reltuples для всей таблицы или число строк из EXPLAIN для
+    запроса с фильтрами. Оценка для фильтров бывает сильно ошибочной,
+    поэтому на небольших выборках ей не доверяем. Если оценки нет
+    (SQLite) или она меньше порога, итог равен порогу и помечается как
+    приблизительный.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = settings.PAGINATOR_COUNT_THRESHOLD
+        self.is_estimated = False
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySetChain):
+            return sum(
+                self.count_queryset(queryset)
+                for queryset in self.object_list.querysets
+            )
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        return self.count_queryset(self.object_list)
+
+    def count_queryset(self, queryset):
+        queryset = queryset.order_by()
+        capped = queryset[:self.threshold + 1].count()
+        if capped <= self.threshold:
+            return capped
+        self.is_estimated = True
+        return max(self.estimate_count(queryset) or 0, capped)
+
+    def estimate_count(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class '
+                    'WHERE oid = to_regclass(%s)',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+                if row and row[0] >= 0:
+                    return int(row[0])
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if not self.is_estimated or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        if not self.count or not self.is_estimated:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
+
+    def _get_page(self, *args, **kwargs):
+        return EstimatedPage(*args, **kwargs)
+
+
+class KeysetPaginator:
+    """Постраничный вывод по курсору вместо OFFSET.
+
+    Курсор — дата и pk последней показанной строки; следующая порция
+    читается по индексу с этого места, без COUNT и пропуска строк.
+    Для QuerySetChain условие применяется к каждому набору, наборы
+    QuerySetMerge сливаются по ключам из одного запроса UNION ALL.
+    """
+
+    def __init__(self, object_list, per_page, field='pub_date'):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.field = field
+
+    def cursor_for(self, obj):
+        return f'{getattr(obj, self.field).isoformat()}_{obj.pk}'
+
+    def parse_cursor(self, cursor):
+        value, _, pk = (cursor or '').rpartition('_')
+        try:
+            return parse_datetime(value), int(pk)
+        except ValueError:
+            return None, None
+
+    def ordered(self):
+        """object_list в порядке курсора.
+
+        Первая страница должна быть отсортирована так же, как порции
+        по курсору, иначе посты с одинаковой датой на стыке пропадут
+        или повторятся.
+        """
+        if isinstance(self.object_list, QuerySetChain):
+            return QuerySetChain(*(
+                self.filter(queryset, None, None)
+                for queryset in self.object_list.querysets
+            ))
+        return self.filter(self.object_list, None, None)
+
+    def filter(self, queryset, value, pk):
+        if value is not None:
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__lt': value})
+                | Q(**{self.field: value, 'pk__lt': pk})
+            )
+        return queryset.order_by(f'-{self.field}', '-pk')
+
+    def merge(self, object_list, value, pk):
+        """Первые per_page + 1 разных строк из всех наборов.
+
+        Из каждого набора достаточно взять столько же строк: строка,
+        попавшая в общую выдачу, не может стоять в своём наборе ниже.
+        Ключи всех порций читаются одним запросом UNION ALL, каждая
+        порция — подзапрос со своими ORDER BY и LIMIT.
+        """
+        parts = []
+        params = []
+        for index, queryset in enumerate(object_list.querysets):
+            stream = self.filter(queryset, value, pk).values_list(
+                'pk', self.field
+            )[:self.per_page + 1]
+            try:
+                sql, stream_params = stream.query.sql_with_params()
+            except EmptyResultSet:
+                continue
+            parts.append(f'SELECT * FROM ({sql}) AS stream_{index}')
+            params.extend(stream_params)
+        if not parts:
+            return []
+        with connections[object_list.base.db].cursor() as cursor:
+            cursor.execute(' UNION ALL '.join(parts), params)
+            rows = cursor.fetchall()
+        field = object_list.base.model._meta.get_field(self.field)
+        keys = sorted(
+            {(field.to_python(key), row_pk) for row_pk, key in rows},
+            reverse=True
+        )[:self.per_page + 1]
+        # Порядок уже известен, поэтому строки сортируются не в БД.
+        objects = object_list.base.in_bulk([row_pk for _, row_pk in keys])
+        return [objects[row_pk] for _, row_pk in keys if row_pk in objects]
+
+    def page(self, cursor=None):
+        """Возвращает строки после курсора и курсор следующей порции."""
+        value, pk = self.parse_cursor(cursor)
+        if isinstance(self.object_list, QuerySetMerge):
+            object_list = self.merge(self.object_list, value, pk)
+        elif isinstance(self.object_list, QuerySetChain):
+            object_list = QuerySetChain(*(
+                self.filter(queryset, value, pk)
+                for queryset in self.object_list.querysets
+            ))
+        else:
+            object_list = self.filter(self.object_list, value, pk)
+        objects = list(object_list[:self.per_page + 1])
+        if len(objects) <= self.per_page:
+            return objects, None
+        objects = objects[:self.per_page]
+        return objects, self.cursor_for(objects[-1])
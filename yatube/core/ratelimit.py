@@ -0,0 +1,96 @@
+import math
+import time
+from functools import wraps
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+
+LOCK_TIMEOUT = 1
+LOCK_ATTEMPTS = 20
+
+
+def _consume(key, tokens, period):
+    """Берёт токен из корзины; возвращает секунды до нового токена или 0.
+
+    В корзине не больше tokens токенов, пустая корзина пополняется
+    равномерно и целиком наполняется за period секунд: пачку запросов
+    можно отправить сразу, но дальше не чаще tokens / period в секунду,
+    в том числе на границе периодов. Остаток и время пополнения лежат
+    в одной записи кеша, а чтение и запись идут под блокировкой
+    cache.add, поэтому лимит соблюдается и при нескольких процессах,
+    если RATELIMIT_CACHE общий (memcached). С LocMemCache у каждого
+    процесса свои корзины, и фактический лимит умножается на число
+    процессов.
+    """
+    cache = caches[settings.RATELIMIT_CACHE]
+    bucket_key = f'ratelimit:{key}'
+    lock_key = f'{bucket_key}:lock'
+    for _ in range(LOCK_ATTEMPTS):
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            break
+        time.sleep(LOCK_TIMEOUT / LOCK_ATTEMPTS)
+    # Блокировку не удалось взять за LOCK_TIMEOUT: её владелец упал,
+    # и запрос считается без неё, как и после истечения её срока.
+    try:
+        now = time.time()
+        rate = tokens / period
+        level, refilled_at = cache.get(bucket_key, (tokens, now))
+        level = min(tokens, level + (now - refilled_at) * rate)
+        if level < 1:
+            return math.ceil((1 - level) / rate)
+        # Без запросов корзина за period наполнится и так.
+        cache.set(bucket_key, (level - 1, now), period)
+        return 0
+    finally:
+        cache.delete(lock_key)
+
+
+def ratelimit(scope, methods=('POST',)):
+    """Ограничивает частоту запросов к представлению.
+
+    Лимиты берутся из settings.RATELIMITS[scope]: отдельно на
+    пользователя и на IP-адрес. При превышении возвращается 429
+    с заголовком Retry-After, само представление не вызывается.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                retry_after = check_limits(request, scope)
+                if retry_after:
+                    return too_many_requests(request, retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def check_limits(request, scope):
+    limits = settings.RATELIMITS.get(scope, {})
+    idents = {'ip': request.META.get('REMOTE_ADDR')}
+    if request.user.is_authenticated:
+        idents['user'] = request.user.pk
+    retry_after = 0
+    for kind, ident in idents.items():
+        if kind in limits:
+            tokens, period = limits[kind]
+            retry_after = max(
+                retry_after,
+                _consume(f'{scope}:{kind}:{ident}', tokens, period)
+            )
+    return retry_after
+
+
+def too_many_requests(request, retry_after):
+    # Шаблон отрисовывается без request, то есть без контекстных
+    # процессоров: отказ не должен стоить запросов к БД.
+    response = HttpResponse(
+        render_to_string('core/429.html', {'retry_after': retry_after}),
+        status=HTTPStatus.TOO_MANY_REQUESTS
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
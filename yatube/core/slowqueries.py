@@ -0,0 +1,120 @@
+"""Журнал медленных SQL-запросов.
+
+Запрос дольше SLOW_QUERY_THRESHOLD секунд пишется в логгер
+yatube.slowqueries одной JSON-строкой: длительность, представление,
+место в коде проекта, откуда он выполнен, и план EXPLAIN. Значения
+параметров в журнал не попадают (в них бывают ключи сессий и данные
+входа) — только их типы; сами значения живут в памяти до EXPLAIN. План
+снимается в отдельном потоке на его собственном соединении, поэтому
+ответ пользователю не ждёт второго запроса к БД.
+"""
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections
+from django.utils import timezone
+
+logger = logging.getLogger('yatube.slowqueries')
+
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN (FORMAT JSON) ',
+    'mysql': 'EXPLAIN FORMAT=JSON ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+STACK_DEPTH = 5
+
+_explainer = ThreadPoolExecutor(max_workers=1)
+
+
+def call_stack():
+    """Кадры кода проекта, начиная с ближайшего к запросу.
+
+    Кадры обёрток execute_wrapper (этой и метрик) пропускаются: поиск
+    начинается снаружи CursorWrapper._execute_with_wrappers.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_name == '_execute_with_wrappers':
+            break
+        frame = frame.f_back
+    frames = []
+    while frame is not None and len(frames) < STACK_DEPTH:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(settings.BASE_DIR)
+            and 'site-packages' not in filename
+        ):
+            frames.append(
+                f'{os.path.relpath(filename, settings.BASE_DIR)}:'
+                f'{frame.f_lineno} in {frame.f_code.co_name}'
+            )
+        frame = frame.f_back
+    return frames
+
+
+def explain(alias, sql, params):
+    prefix = EXPLAIN_PREFIXES.get(connections[alias].vendor)
+    if prefix is None or not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [list(row) for row in cursor.fetchall()]
+    except Exception as error:
+        return f'EXPLAIN не выполнен: {error}'
+
+
+def write_record(record, alias, params):
+    record['plan'] = explain(alias, record['sql'], params)
+    logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def flush():
+    """Дожидается записи всех уже найденных медленных запросов."""
+    _explainer.submit(lambda: None).result()
+
+
+class SlowQueryMiddleware:
+    """Подключает к соединению обёртку, замеряющую каждый запрос."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.SLOW_QUERY_THRESHOLD is None:
+            return self.get_response(request)
+
+        def log_slow_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                duration = time.perf_counter() - started
+                if duration >= settings.SLOW_QUERY_THRESHOLD:
+                    stack = call_stack()
+                    match = request.resolver_match
+                    record = {
+                        'time': timezone.now().isoformat(),
+                        'duration_ms': round(duration * 1000, 3),
+                        'view': match.view_name if match else None,
+                        'method': request.method,
+                        'path': request.path,
+                        'call_site': stack[0] if stack else None,
+                        'stack': stack,
+                        'sql': sql,
+                        'param_types': None if many else [
+                            type(param).__name__ for param in params or ()
+                        ],
+                    }
+                    _explainer.submit(
+                        write_record, record, context['connection'].alias,
+                        None if many else params,
+                    )
+
+        with connection.execute_wrapper(log_slow_query):
+            return self.get_response(request)
@@ -1,5 +1,8 @@
 # core/templatetags/user_filters.py
 from django import template
+
+from posts.tags import linkify
+
 # В template.Library зарегистрированы все встроенные теги и фильтры шаблонов;
 # добавляем к ним и наш фильтр.
 register = template.Library()
@@ -9,6 +12,10 @@ register = template.Library()
 def addclass(field, css):
     return field.as_widget(attrs={'class': css})
 
+
 # синтаксис @register... , под который описана функция addclass() -
 # это применение "декораторов", функций, меняющих поведение функций
 # Не бойтесь соб@к
+
+# #теги и @имена в тексте поста становятся ссылками.
+register.filter('linkify', linkify)
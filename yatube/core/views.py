@@ -1,6 +1,12 @@
 from http import HTTPStatus
 
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.cache import cache_control
+
+from .metrics import REGISTRY
 
 
 def page_not_found(request, exception):
@@ -18,3 +24,23 @@ def csrf_failure(request, reason=''):
 
 def server_error(request):
     return render(request, 'core/500.html')
+
+
+def metrics_allowed(request):
+    """Токен METRICS_TOKEN, если он задан, иначе адрес из списка."""
+    if settings.METRICS_TOKEN:
+        return constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''),
+            f'Bearer {settings.METRICS_TOKEN}'
+        )
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+@cache_control(private=True, no_store=True)
+def metrics(request):
+    """Метрики всех процессов в текстовом формате Prometheus."""
+    if not metrics_allowed(request):
+        raise Http404
+    return HttpResponse(
+        REGISTRY.render(), content_type='text/plain; version=0.0.4'
+    )
@@ -1,9 +1,92 @@
+from datetime import datetime, time
+
+from django.conf import settings
 from django.contrib import admin
-from .models import Post, Group
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
+from django.db import connection, models
+from django.utils import timezone
+
+from core.paginator import EstimatedCountPaginator
+
+from .jobs import schedule_deletion
+from .models import (
+    Comment, Follow, Group, GroupSubscription, PendingDeletion, Post
+)
+
+User = get_user_model()
+
+
+class IndexedDatesQuerySet(models.QuerySet):
+    """QuerySet, у которого dates() идёт по индексу, а не по всей таблице.
+
+    Вместо SELECT DISTINCT по всем строкам выполняется серия Max() с
+    ограничением сверху: по одному запросу на каждый год, месяц или день.
+    """
+
+    def dates(self, field_name, kind, order='ASC'):
+        values = []
+        queryset = self.order_by()
+        while True:
+            latest = queryset.aggregate(
+                latest=models.Max(field_name)
+            )['latest']
+            if latest is None:
+                break
+            if isinstance(latest, datetime):
+                latest = timezone.localtime(latest).date()
+            if kind == 'year':
+                latest = latest.replace(month=1, day=1)
+            elif kind == 'month':
+                latest = latest.replace(day=1)
+            values.append(latest)
+            boundary = datetime.combine(latest, time.min)
+            if settings.USE_TZ:
+                boundary = timezone.make_aware(boundary)
+            queryset = self.order_by().filter(
+                **{f'{field_name}__lt': boundary}
+            )
+        if order == 'ASC':
+            values.reverse()
+        return values
+
+
+class FullTextSearchMixin:
+    """Полнотекстовый поиск по GIN-индексу в PostgreSQL вместо ILIKE.
+
+    На других СУБД используется обычный поиск по search_fields.
+    """
+    full_text_field = 'text'
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or connection.vendor != 'postgresql':
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        column = f'{self.model._meta.db_table}.{self.full_text_field}'
+        queryset = queryset.extra(
+            where=[
+                f"to_tsvector('russian', {column}) "
+                f"@@ plainto_tsquery('russian', %s)"
+            ],
+            params=[search_term],
+        )
+        return queryset, False
+
+
+def schedule_deletion_action(modeladmin, request, queryset):
+    for target in queryset:
+        schedule_deletion(target)
+    modeladmin.message_user(
+        request, f'Поставлено в очередь на удаление: {len(queryset)}'
+    )
+
+
+schedule_deletion_action.short_description = 'Удалить в фоне'
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'text',
@@ -11,10 +94,77 @@ class PostAdmin(admin.ModelAdmin):
         'author',
         'group',
     )
-    list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group', 'last_comment')
     search_fields = ('text',)
-    list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
     empty_value_display = '-пусто-'
 
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(
+            self.model, query=queryset.query, using=queryset.db
+        )
+
+
+@admin.register(Group)
+class GroupAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'title', 'slug')
+    actions = (schedule_deletion_action,)
+    search_fields = ('title', 'slug')
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+
+@admin.register(Comment)
+class CommentAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'text',
+        'created',
+        'author',
+        'post',
+    )
+    list_select_related = ('author', 'post')
+    autocomplete_fields = ('author', 'post')
+    search_fields = ('text',)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    empty_value_display = '-пусто-'
+
+
+@admin.register(Follow)
+class FollowAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('user__username__exact', 'author__username__exact')
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+
+@admin.register(GroupSubscription)
+class GroupSubscriptionAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'group')
+    list_select_related = ('user', 'group')
+    autocomplete_fields = ('user', 'group')
+    search_fields = ('user__username__exact', 'group__slug__exact')
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+
+@admin.register(PendingDeletion)
+class PendingDeletionAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'group', 'created')
+    list_select_related = ('user', 'group')
+    autocomplete_fields = ('user', 'group')
+
+
+admin.site.unregister(User)
+
 
-admin.site.register(Group)
+@admin.register(User)
+class DeferredDeletionUserAdmin(UserAdmin):
+    actions = (schedule_deletion_action,)
@@ -0,0 +1,110 @@
+import atexit
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db.models import (
+    Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+)
+from django.db.models.functions import Coalesce
+
+from .models import Comment, PendingDeletion, Post
+
+
+class ViewCounter:
+    """Буфер просмотров постов в памяти процесса.
+
+    Каждый просмотр только увеличивает счётчик в словаре. Раз в
+    VIEW_COUNTER_FLUSH_INTERVAL секунд (или при VIEW_COUNTER_MAX_PENDING
+    постах в буфере) накопленные приращения записываются одним UPDATE
+    с CASE по группам постов с одинаковым приращением. Поэтому строка
+    популярного поста блокируется один раз за период, а не на каждый
+    просмотр, а Post.views отстаёт от реального числа на этот период.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.flushed_at = time.monotonic()
+
+    def add(self, post_id, count=1):
+        with self.lock:
+            self.pending[post_id] += count
+            due = (
+                time.monotonic() - self.flushed_at
+                >= settings.VIEW_COUNTER_FLUSH_INTERVAL
+                or len(self.pending) >= settings.VIEW_COUNTER_MAX_PENDING
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленное в БД; возвращает число постов."""
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            apply_view_deltas(pending)
+        except Exception:
+            with self.lock:
+                self.pending.update(pending)
+            raise
+        return len(pending)
+
+
+def apply_view_deltas(deltas):
+    """Прибавляет просмотры одним UPDATE: {post_id: приращение}."""
+    by_delta = defaultdict(list)
+    for post_id, delta in deltas.items():
+        by_delta[delta].append(post_id)
+    Post.objects.filter(pk__in=sorted(deltas)).update(
+        views=F('views') + Case(
+            *(
+                When(pk__in=post_ids, then=Value(delta))
+                for delta, post_ids in by_delta.items()
+            ),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+
+
+def recount_comments(posts):
+    """Пересчитывает comments_count и last_comment у постов posts.
+
+    Учитываются только видимые комментарии: авторы, поставленные
+    в очередь на удаление, пропускаются так же, как на странице поста.
+    """
+    visible = Comment.objects.filter(post=OuterRef('pk')).exclude(
+        author__in=PendingDeletion.objects.filter(
+            user__isnull=False
+        ).values('user')
+    )
+    posts.update(
+        comments_count=Coalesce(Subquery(
+            visible.order_by().values('post').annotate(
+                count=Count('pk')
+            ).values('count'),
+            output_field=IntegerField(),
+        ), 0),
+        last_comment=Subquery(
+            visible.order_by('-created', '-pk').values('pk')[:1]
+        ),
+    )
+
+
+view_counter = ViewCounter()
+
+
+def _flush_at_exit():
+    try:
+        view_counter.flush()
+    except Exception:
+        # При остановке процесса БД может быть уже недоступна.
+        pass
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,96 @@
+from django.db import connection
+from django.db.models import Q
+
+from core import pagecache
+
+from .models import FeedState, Follow, GroupSubscription, Post, User
+
+# Больше авторов за один запрос к API не принимается.
+MAX_BULK_FOLLOWS = 500
+
+
+def _purge(pairs):
+    user_ids = {user_id for pair in pairs for user_id in pair}
+    pagecache.purge(*(f'auth.user:{user_id}' for user_id in user_ids))
+
+
+def recount_unread(user_ids):
+    """Пересчитывает счётчики непрочитанного после смены подписок.
+
+    Непрочитанными считаются посты новее last_seen от авторов и групп,
+    на которые пользователь подписан сейчас. Один COUNT на пользователя:
+    списки в массовых операциях ограничены MAX_BULK_FOLLOWS.
+    """
+    for state in FeedState.objects.filter(user_id__in=user_ids):
+        unread = Post.objects.filter(
+            Q(author__in=Follow.objects.filter(
+                user_id=state.user_id
+            ).values('author'))
+            | Q(group__in=GroupSubscription.objects.filter(
+                user_id=state.user_id
+            ).values('group')),
+            pub_date__gt=state.last_seen,
+        ).count()
+        FeedState.objects.filter(pk=state.pk).update(unread_count=unread)
+
+
+def follow_pairs(pairs, batch_size=1000):
+    """Создаёт подписки по парам (user_id, author_id) пачками.
+
+    Уже существующие подписки пропускает ограничение unique_following.
+    bulk_create не отправляет сигналы, поэтому состояние ленты и
+    сброс кеша страниц выполняются здесь же. Возвращает число новых
+    подписок: разницу числа подписок этих пользователей до и после.
+    """
+    pairs = {(user, author) for user, author in pairs if user != author}
+    follows = Follow.objects.filter(
+        user_id__in={user for user, _ in pairs},
+        author_id__in={author for _, author in pairs},
+    )
+    before = follows.count() if pairs else 0
+    Follow.objects.bulk_create(
+        (Follow(user_id=user, author_id=author) for user, author in pairs),
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    user_ids = {user for user, _ in pairs}
+    FeedState.objects.bulk_create(
+        (FeedState(user_id=user) for user in user_ids),
+        batch_size=batch_size,
+        ignore_conflicts=True,
+    )
+    recount_unread(user_ids)
+    _purge(pairs)
+    return follows.count() - before if pairs else 0
+
+
+def unfollow_pairs(pairs):
+    """Удаляет подписки по парам (user_id, author_id) без сигналов:
+    одним DELETE на каждого подписчика."""
+    pairs = set(pairs)
+    deleted = 0
+    authors_by_user = {}
+    for user, author in pairs:
+        authors_by_user.setdefault(user, []).append(author)
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for user, authors in authors_by_user.items():
+            cursor.execute(
+                'DELETE FROM {} WHERE {} = %s AND {} IN ({})'.format(
+                    quote_name(Follow._meta.db_table),
+                    quote_name('user_id'),
+                    quote_name('author_id'),
+                    ', '.join(['%s'] * len(authors)),
+                ),
+                [user, *authors],
+            )
+            deleted += cursor.rowcount
+    recount_unread(authors_by_user)
+    _purge(pairs)
+    return deleted
+
+
+def author_ids(usernames):
+    return User.objects.filter(username__in=usernames).values_list(
+        'pk', flat=True
+    )
@@ -1,5 +1,6 @@
 from django import forms
 
+from .minhash import find_duplicates
 from .models import Post, Comment
 
 
@@ -17,6 +18,14 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой относится пост',
         }
 
+    def clean_text(self):
+        text = self.cleaned_data['text']
+        if find_duplicates(text, self.instance.pk):
+            raise forms.ValidationError(
+                'Почти такой же пост уже опубликован.'
+            )
+        return text
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
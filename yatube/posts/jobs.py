@@ -0,0 +1,380 @@
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from sorl.thumbnail import delete as delete_image
+
+from core.metrics import Gauge
+
+from .counters import recount_comments
+from .models import (
+    ArchivedComment, ArchivedPost, ArchivedPostRevision, Comment, Follow,
+    Group, GroupStats, GroupSubscription, JobCheckpoint, PendingDeletion,
+    Post, PostRevision, PostScore, User,
+)
+
+COMMENT_WEIGHT = 1.0
+FOLLOWER_COMMENT_WEIGHT = 2.0
+FOLLOW_WEIGHT = 3.0
+
+
+def refresh_group_stats(batch_size=500):
+    """Пересчитывает агрегаты только для групп, помеченных как изменённые.
+
+    Флаг снимается до подсчёта: если пост появится во время пересчёта,
+    группа снова станет «грязной» и попадёт в следующий запуск.
+
+    Инкрементальность здесь по группам, а не по постам: для помеченной
+    группы агрегаты считаются заново по индексу group_id. Дельты из
+    сигналов расходились бы с таблицами: их не видят queryset.update()
+    и bulk_create(), а переносы между группами и архивация требуют
+    согласованных правок сразу двух счётчиков. Пересчёт сам
+    исправляет такой дрейф при следующей пометке группы.
+    """
+    refreshed = 0
+    while True:
+        ids = list(
+            GroupStats.objects.filter(is_dirty=True).values_list(
+                'group_id', flat=True
+            )[:batch_size]
+        )
+        if not ids:
+            return refreshed
+        GroupStats.objects.filter(group_id__in=ids).update(is_dirty=False)
+        aggregates = {}
+        for model in (Post, ArchivedPost):
+            for row in model.objects.filter(group_id__in=ids).order_by(
+            ).values('group_id').annotate(
+                posts_count=Count('pk'), last_activity=Max('pub_date')
+            ):
+                group_id = row.pop('group_id')
+                if group_id in aggregates:
+                    row['posts_count'] += aggregates[group_id]['posts_count']
+                    row['last_activity'] = max(
+                        row['last_activity'],
+                        aggregates[group_id]['last_activity'],
+                    )
+                aggregates[group_id] = row
+        for group_id in ids:
+            row = aggregates.get(group_id)
+            if row is None:
+                # Время последней активности у опустевшей группы не меняется.
+                row = {'posts_count': 0}
+            GroupStats.objects.filter(group_id=group_id).update(**row)
+        refreshed += len(ids)
+
+
+def _log_add(a, b):
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _decayed(weight, moment):
+    tau = settings.TRENDING_HALF_LIFE / math.log(2)
+    return math.log(weight) + moment.timestamp() / tau
+
+
+def _checkpoint(name):
+    checkpoint, _ = JobCheckpoint.objects.select_for_update().get_or_create(
+        name=name
+    )
+    return checkpoint
+
+
+def _apply_scores(increments):
+    """Прибавляет вклады вида {post_id: (log_score, момент)} к рейтингам."""
+    existing = PostScore.objects.select_for_update().in_bulk(
+        list(increments)
+    )
+    new_scores = []
+    for post_id, (score, moment) in increments.items():
+        post_score = existing.get(post_id)
+        if post_score is None:
+            new_scores.append(
+                PostScore(post_id=post_id, score=score, last_activity=moment)
+            )
+            continue
+        post_score.score = _log_add(post_score.score, score)
+        post_score.last_activity = max(post_score.last_activity, moment)
+    PostScore.objects.bulk_update(
+        existing.values(), ['score', 'last_activity']
+    )
+    PostScore.objects.bulk_create(new_scores)
+
+
+def _comment_increments(comments, cutoff):
+    follows = set(
+        Follow.objects.filter(
+            user_id__in={c['author_id'] for c in comments},
+            author_id__in={c['post__author_id'] for c in comments},
+        ).values_list('user_id', 'author_id')
+    )
+    increments = {}
+    for comment in comments:
+        if comment['created'] < cutoff or comment['post__pub_date'] < cutoff:
+            continue
+        weight = COMMENT_WEIGHT
+        if (comment['author_id'], comment['post__author_id']) in follows:
+            weight += FOLLOWER_COMMENT_WEIGHT
+        score, moment = increments.get(comment['post_id'], (None, cutoff))
+        increments[comment['post_id']] = (
+            _log_add(score, _decayed(weight, comment['created'])),
+            max(moment, comment['created']),
+        )
+    return increments
+
+
+def _follow_increments(follows, now, cutoff):
+    new_followers = Counter(follows)
+    posts = defaultdict(list)
+    for post_id, author_id in Post.objects.filter(
+        author_id__in=new_followers, pub_date__gte=cutoff
+    ).order_by().values_list('pk', 'author_id'):
+        posts[author_id].append(post_id)
+    increments = {}
+    for author_id, count in new_followers.items():
+        score = _decayed(FOLLOW_WEIGHT * count, now)
+        for post_id in posts[author_id]:
+            increments[post_id] = (score, now)
+    return increments
+
+
+def update_trending(batch_size=1000):
+    """Дополняет рейтинги новыми комментариями и подписками.
+
+    Обрабатываются только строки Comment и Follow с id больше
+    сохранённой контрольной точки; у Follow нет даты, поэтому
+    подписка учитывается моментом обработки.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.TRENDING_WINDOW)
+    processed = 0
+    while True:
+        with transaction.atomic():
+            checkpoint = _checkpoint('trending_comments')
+            comments = list(
+                Comment.objects.filter(pk__gt=checkpoint.position).order_by(
+                    'pk'
+                ).values(
+                    'pk', 'post_id', 'author_id', 'created',
+                    'post__author_id', 'post__pub_date',
+                )[:batch_size]
+            )
+            if not comments:
+                break
+            _apply_scores(_comment_increments(comments, cutoff))
+            checkpoint.position = comments[-1]['pk']
+            checkpoint.save()
+            processed += len(comments)
+    while True:
+        with transaction.atomic():
+            checkpoint = _checkpoint('trending_follows')
+            follows = list(
+                Follow.objects.filter(pk__gt=checkpoint.position).order_by(
+                    'pk'
+                ).values_list('pk', 'author_id')[:batch_size]
+            )
+            if not follows:
+                break
+            _apply_scores(_follow_increments(
+                [author_id for _, author_id in follows], now, cutoff
+            ))
+            checkpoint.position = follows[-1][0]
+            checkpoint.save()
+            processed += len(follows)
+    PostScore.objects.filter(last_activity__lt=cutoff).delete()
+    return processed
+
+
+def archive_posts(cutoff, batch_size=500):
+    """Переносит посты старше cutoff вместе с комментариями в архив.
+
+    Каждая пачка переносится в своей транзакции: копии создаются с
+    теми же id, после чего оригиналы удаляются из горячих таблиц.
+    История правок переносится вместе с постом.
+
+    Ленты тегов и упоминания, индекс дубликатов и рейтинг «Популярного»
+    строятся только по горячей таблице, поэтому их строки (TaggedPost,
+    Mention, PostSignature, LshBucket, PostScore) не архивируются, а
+    удаляются вместе с постом.
+    """
+    archived = 0
+    while True:
+        with transaction.atomic():
+            posts = list(
+                Post.objects.select_for_update().filter(
+                    pub_date__lt=cutoff
+                ).order_by('pub_date', 'pk')[:batch_size]
+            )
+            if not posts:
+                return archived
+            ids = [post.pk for post in posts]
+            ArchivedPost.objects.bulk_create([
+                ArchivedPost(
+                    id=post.pk,
+                    pub_date=post.pub_date,
+                    text=post.text,
+                    author_id=post.author_id,
+                    group_id=post.group_id,
+                    image=post.image.name,
+                    comments_count=post.comments_count,
+                    views=post.views,
+                )
+                for post in posts
+            ])
+            comments = Comment.objects.filter(post_id__in=ids)
+            ArchivedComment.objects.bulk_create(
+                ArchivedComment(**comment)
+                for comment in comments.order_by().values(
+                    'id', 'post_id', 'author_id', 'text', 'created'
+                )
+            )
+            ArchivedPostRevision.objects.bulk_create(
+                ArchivedPostRevision(**revision)
+                for revision in PostRevision.objects.filter(
+                    post_id__in=ids
+                ).order_by().values(
+                    'post_id', 'number', 'created', 'is_snapshot', 'data'
+                )
+            )
+            # Счётчики уже скопированы, поэтому комментарии удаляются
+            # одним DELETE без сигналов, а ссылки на них обнуляются
+            # заранее.
+            Post.objects.filter(pk__in=ids).update(last_comment=None)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'DELETE FROM {} WHERE {} IN ({})'.format(
+                        connection.ops.quote_name(Comment._meta.db_table),
+                        connection.ops.quote_name('post_id'),
+                        ', '.join(['%s'] * len(ids)),
+                    ),
+                    ids,
+                )
+            Post.objects.filter(pk__in=ids).delete()
+            archived += len(posts)
+
+
+def schedule_deletion(target):
+    """Ставит пользователя или группу в очередь на удаление.
+
+    Пользователь сразу деактивируется: не может войти, а его посты и
+    комментарии пропадают из лент, в том числе из превью последнего
+    комментария на карточках. Сами строки удаляет process_deletions.
+    """
+    with transaction.atomic():
+        if isinstance(target, Group):
+            PendingDeletion.objects.get_or_create(group=target)
+            return
+        User.objects.filter(pk=target.pk).update(is_active=False)
+        PendingDeletion.objects.get_or_create(user=target)
+        recount_comments(Post.objects.filter(
+            pk__in=Comment.objects.filter(author=target).values('post')
+        ))
+
+
+def _delete_images(names):
+    for name in names:
+        delete_image(name)
+
+
+def _delete_in_batches(queryset, batch_size):
+    """Удаляет строки пачками, каждую в отдельной транзакции.
+
+    Картинки постов и их миниатюры удаляются после коммита пачки.
+    """
+    deleted = 0
+    model = queryset.model
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            batch = model.objects.filter(pk__in=ids)
+            if model in (Post, ArchivedPost):
+                images = list(
+                    batch.exclude(image='').values_list('image', flat=True)
+                )
+                transaction.on_commit(partial(_delete_images, images))
+            batch.delete()
+            deleted += len(ids)
+
+
+def _detach_in_batches(queryset, batch_size):
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return
+            queryset.model.objects.filter(pk__in=ids).update(group=None)
+
+
+def process_deletions(batch_size=500):
+    """Удаляет поставленных в очередь пользователей и группы.
+
+    Зависимые строки удаляются короткими транзакциями, поэтому таблицы
+    не блокируются надолго, а прерванный запуск продолжается с того же
+    места. Возвращает число удалённых пользователей и групп.
+    """
+    processed = 0
+    for pending in PendingDeletion.objects.select_related('user', 'group'):
+        user, group = pending.user, pending.group
+        if user is not None:
+            for queryset in (
+                Follow.objects.filter(user=user),
+                Follow.objects.filter(author=user),
+                GroupSubscription.objects.filter(user=user),
+                Comment.objects.filter(author=user),
+                ArchivedComment.objects.filter(author=user),
+                Post.objects.filter(author=user),
+                ArchivedPost.objects.filter(author=user),
+            ):
+                _delete_in_batches(queryset, batch_size)
+            user.delete()
+        else:
+            _delete_in_batches(
+                GroupSubscription.objects.filter(group=group), batch_size
+            )
+            for model in (Post, ArchivedPost):
+                _detach_in_batches(model.objects.filter(group=group),
+                                   batch_size)
+            group.delete()
+        processed += 1
+    return processed
+
+
+def queue_depths():
+    """Необработанные строки фоновых задач, не больше порога пагинатора."""
+    limit = settings.PAGINATOR_COUNT_THRESHOLD
+    archive_cutoff = timezone.now() - timedelta(
+        days=settings.ARCHIVE_AFTER_DAYS
+    )
+    checkpoints = dict(
+        JobCheckpoint.objects.values_list('name', 'position')
+    )
+    queues = {
+        'deletions': PendingDeletion.objects.all(),
+        'group_stats': GroupStats.objects.filter(is_dirty=True),
+        'archive': Post.objects.filter(pub_date__lt=archive_cutoff),
+        'trending_comments': Comment.objects.filter(
+            pk__gt=checkpoints.get('trending_comments', 0)
+        ),
+        'trending_follows': Follow.objects.filter(
+            pk__gt=checkpoints.get('trending_follows', 0)
+        ),
+    }
+    for queue, queryset in queues.items():
+        yield {'queue': queue}, queryset.order_by()[:limit].count()
+
+
+QUEUE_DEPTH = Gauge(
+    'yatube_job_queue_depth',
+    'Строки, ожидающие фоновых задач (команд из cron).',
+    queue_depths
+)
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.jobs import archive_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит старые посты и их комментарии в архивные таблицы, '
+        'чтобы горячие таблицы и индексы оставались небольшими (cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_AFTER_DAYS
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        archived = archive_posts(cutoff, options['batch_size'])
+        self.stdout.write(f'Перенесено в архив постов: {archived}')
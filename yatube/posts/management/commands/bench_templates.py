@@ -0,0 +1,53 @@
+import timeit
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.template import engines
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время отрисовки страницы группы с 10 и 100 постами '
+        'на шаблонах Django и Jinja2. Данные в БД не записываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, nargs='+', default=[10, 100]
+        )
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        group = Group(pk=1, title='Группа', slug='bench', description='')
+        author = User(pk=1, username='bench', first_name='Bench')
+        request = RequestFactory().get(
+            reverse('posts:group_list', kwargs={'slug': group.slug})
+        )
+        request.user = AnonymousUser()
+        for count in options['posts']:
+            posts = [
+                Post(
+                    pk=i, text=f'Пост {i} ' * 20, author=author, group=group,
+                    pub_date=timezone.now(),
+                )
+                for i in range(1, count + 1)
+            ]
+            page_obj = Paginator(posts, count).get_page(1)
+            page_obj.next_cursor = None
+            context = {'group': group, 'page_obj': page_obj}
+            for name in ('django', 'jinja2'):
+                template = engines[name].get_template('posts/group_list.html')
+                seconds = timeit.timeit(
+                    lambda: template.render(context, request),
+                    number=options['repeat'],
+                )
+                self.stdout.write(
+                    f'{name:>6}, постов {count:>4}: '
+                    f'{seconds / options["repeat"] * 1000:.2f} мс'
+                )
@@ -0,0 +1,92 @@
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from posts import minhash
+from posts.models import LshBucket, Post, PostSignature
+
+
+class Command(BaseCommand):
+    help = (
+        'Считает MinHash-сигнатуры постов, у которых их ещё нет, и '
+        'выводит группы почти одинаковых постов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--min-size', type=int, default=2)
+
+    def handle(self, *args, **options):
+        indexed = self.index_missing(options['batch_size'])
+        self.stdout.write(f'Посчитано сигнатур: {indexed}')
+        clusters = self.clusters()
+        clusters = [
+            cluster for cluster in clusters
+            if len(cluster) >= options['min_size']
+        ]
+        authors = dict(
+            Post.objects.filter(
+                pk__in=[pk for cluster in clusters for pk in cluster]
+            ).values_list('pk', 'author__username')
+        )
+        for cluster in sorted(clusters, key=len, reverse=True):
+            self.stdout.write(
+                f'{len(cluster)} постов, авторов: '
+                f'{len({authors.get(pk) for pk in cluster})}: '
+                + ', '.join(map(str, sorted(cluster)))
+            )
+        self.stdout.write(f'Групп дубликатов: {len(clusters)}')
+
+    def index_missing(self, batch_size):
+        """Сигнатуры для постов без них, пачками по batch_size."""
+        indexed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                Post.objects.filter(
+                    pk__gt=last_pk, signature__isnull=True
+                ).order_by('pk').values_list('pk', 'text')[:batch_size]
+            )
+            if not batch:
+                return indexed
+            minhash.index_posts(batch)
+            indexed += sum(minhash.is_checked(text) for _, text in batch)
+            last_pk = batch[-1][0]
+
+    def clusters(self):
+        """Объединяет посты из общих корзин LSH, проверяя сходство."""
+        signatures = {
+            pk: np.frombuffer(signature, np.uint32)
+            for pk, signature in PostSignature.objects.values_list(
+                'post_id', 'signature'
+            ).iterator()
+        }
+        parent = {}
+
+        def find(pk):
+            parent.setdefault(pk, pk)
+            while parent[pk] != pk:
+                parent[pk] = parent[parent[pk]]
+                pk = parent[pk]
+            return pk
+
+        # Корзины читаются по индексу key подряд, без словаря в памяти.
+        rows = LshBucket.objects.order_by('key').values_list(
+            'key', 'post_id'
+        ).iterator()
+        for _, group in groupby(rows, key=itemgetter(0)):
+            members = [pk for _, pk in group]
+            for index, pk in enumerate(members):
+                for other in members[:index]:
+                    if minhash.similarity(
+                        signatures[other], signatures[pk]
+                    ) >= minhash.THRESHOLD:
+                        parent[find(pk)] = find(other)
+                        break
+        clusters = defaultdict(set)
+        for pk in parent:
+            clusters[find(pk)].add(pk)
+        return list(clusters.values())
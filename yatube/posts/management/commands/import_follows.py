@@ -0,0 +1,57 @@
+import csv
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts.follows import follow_pairs, unfollow_pairs
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует подписки из CSV-файла со строками '
+        '«подписчик,автор» (имена пользователей) пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--unfollow',
+            action='store_true',
+            help='Удалить перечисленные подписки вместо создания.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            source = open(options['path'], newline='', encoding='utf-8')
+        except OSError as error:
+            raise CommandError(error)
+        action = unfollow_pairs if options['unfollow'] else follow_pairs
+        processed = skipped = 0
+        with source:
+            rows = csv.reader(source)
+            while True:
+                chunk = list(islice(rows, options['batch_size']))
+                if not chunk:
+                    break
+                batch = [row for row in chunk if len(row) >= 2]
+                names = {name.strip() for row in batch for name in row[:2]}
+                ids = dict(
+                    User.objects.filter(username__in=names).values_list(
+                        'username', 'pk'
+                    )
+                )
+                pairs = [
+                    (ids.get(user.strip()), ids.get(author.strip()))
+                    for user, author, *_ in batch
+                ]
+                known = [pair for pair in pairs if None not in pair]
+                with transaction.atomic():
+                    action(known)
+                processed += len(known)
+                skipped += len(pairs) - len(known)
+        self.stdout.write(
+            f'Обработано подписок: {processed}, пропущено: {skipped}'
+        )
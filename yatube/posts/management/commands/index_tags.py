@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.tags import backfill
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет индекс хештегов и упоминаний для постов, '
+        'опубликованных до его появления.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        processed = backfill(options['batch_size'])
+        self.stdout.write(f'Проиндексировано постов: {processed}')
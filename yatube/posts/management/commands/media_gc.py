@@ -0,0 +1,125 @@
+import os
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts.models import ArchivedPost, Post
+
+POSTS_DIR = Post._meta.get_field('image').upload_to
+CHUNK_SIZE = 2000
+
+
+def walk_files(root, relative=''):
+    """Потоково обходит каталог, не собирая список файлов целиком."""
+    try:
+        entries = os.scandir(os.path.join(root, relative))
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            name = os.path.join(relative, entry.name).replace(os.sep, '/')
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(root, name)
+            elif entry.is_file(follow_symlinks=False):
+                yield name, entry.stat(follow_symlinks=False)
+
+
+def referenced_images():
+    """Имена картинок, на которые ссылаются посты, в том числе архивные."""
+    names = set()
+    for model in (Post, ArchivedPost):
+        images = model.objects.exclude(image='').values_list(
+            'image', flat=True
+        )
+        names.update(images.iterator(chunk_size=CHUNK_SIZE))
+    return names
+
+
+def referenced_thumbnails(sources):
+    """Имена миниатюр из KV-хранилища sorl, источник которых ещё жив."""
+    image_prefix = add_prefix('', 'image')
+    thumbnails_prefix = add_prefix('', 'thumbnails')
+    names = {}
+    thumbnails = {}
+    rows = KVStore.objects.filter(
+        key__startswith=thumbnail_settings.THUMBNAIL_KEY_PREFIX
+    ).values_list('key', 'value')
+    for key, value in rows.iterator(chunk_size=CHUNK_SIZE):
+        if key.startswith(image_prefix):
+            names[del_prefix(key)] = deserialize(value)['name']
+        elif key.startswith(thumbnails_prefix):
+            thumbnails[del_prefix(key)] = deserialize(value)
+    live = set()
+    for source_key, thumbnail_keys in thumbnails.items():
+        if names.get(source_key) not in sources:
+            continue
+        live.update(
+            names[key] for key in thumbnail_keys if key in names
+        )
+    return live
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из media/posts/ и media/cache/ файлы, на которые '
+        'не ссылаются ни посты, ни KV-хранилище миниатюр.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.'
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе указанного числа секунд.'
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.deadline = time.time() - options['min_age']
+        root = default_storage.location
+
+        sources = referenced_images()
+        thumbnails = referenced_thumbnails(sources)
+
+        total_files = total_bytes = 0
+        for directory, referenced in (
+            (POSTS_DIR, sources),
+            (thumbnail_settings.THUMBNAIL_PREFIX, thumbnails),
+        ):
+            files, size = self.collect(root, directory, referenced)
+            total_files += files
+            total_bytes += size
+            self.stdout.write(
+                f'{directory}: файлов-сирот {files}, {size} байт'
+            )
+
+        if self.dry_run:
+            self.stdout.write(
+                f'Можно освободить {total_bytes} байт '
+                f'({total_files} файлов). Ничего не удалено.'
+            )
+            return
+        default.kvstore.cleanup()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено {total_files} файлов, освобождено {total_bytes} байт.'
+        ))
+
+    def collect(self, root, directory, referenced):
+        """Удаляет сирот по ходу обхода, не копя их список в памяти."""
+        files = size = 0
+        for name, stat in walk_files(root, directory.strip('/')):
+            if name in referenced or stat.st_mtime > self.deadline:
+                continue
+            files += 1
+            size += stat.st_size
+            if not self.dry_run:
+                default_storage.delete(name)
+        return files, size
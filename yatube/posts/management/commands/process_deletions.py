@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.jobs import process_deletions
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет поставленных в очередь пользователей и группы вместе '
+        'с зависимыми строками и файлами, небольшими пачками (cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        processed = process_deletions(options['batch_size'])
+        self.stdout.write(f'Удалено пользователей и групп: {processed}')
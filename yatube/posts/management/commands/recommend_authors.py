@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.recommendations import recommend_authors
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рекомендации «на кого подписаться» по графу '
+        'подписок (друзья друзей и совместные подписки). Запускается '
+        'периодически (cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('-k', type=int, default=10)
+        parser.add_argument('--block-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        users = recommend_authors(options['k'], options['block_size'])
+        self.stdout.write(
+            f'Рекомендации для {users} пользователей '
+            f'за {time.monotonic() - started:.1f} с'
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.jobs import refresh_group_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает количество постов и время последней активности '
+        'для изменившихся групп. Запускается периодически (cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        refreshed = refresh_group_stats(options['batch_size'])
+        self.stdout.write(f'Обновлено групп: {refreshed}')
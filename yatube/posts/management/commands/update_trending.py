@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.jobs import update_trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет рейтинг ленты «Популярное» по новым комментариям '
+        'и подпискам с момента предыдущего запуска (cron).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        processed = update_trending(options['batch_size'])
+        self.stdout.write(f'Обработано событий: {processed}')
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.warmup import (
+    default_paths, paths_from_log, thumbnail_sources, warm
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогревает кеши после деплоя: параллельно создаёт миниатюры '
+        'и запрашивает самые посещаемые страницы у запущенного сервера.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url',
+            default='http://127.0.0.1:8000',
+            help='Адрес сервера, кеш которого нужно прогреть.'
+        )
+        parser.add_argument(
+            '--access-log',
+            help=(
+                'Журнал доступа или файл «путь число»; без него страницы '
+                'выбираются по активности групп и рейтингу постов.'
+            )
+        )
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--thumbnails', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        if options['access_log']:
+            try:
+                with open(options['access_log'], encoding='utf-8',
+                          errors='replace') as log:
+                    paths = paths_from_log(log, limit)
+            except OSError as error:
+                raise CommandError(error)
+        else:
+            paths = default_paths(limit)
+        images = thumbnail_sources(options['thumbnails'])
+        started = time.monotonic()
+        failed = 0
+        for target, status, seconds in warm(
+            options['base_url'], paths, images,
+            options['workers'], options['timeout']
+        ):
+            if status not in (200, 'ok'):
+                failed += 1
+            self.stdout.write(f'{status} {seconds * 1000:.0f} мс {target}')
+        self.stdout.write(
+            f'Страниц: {len(paths)}, миниатюр: {len(images)}, '
+            f'ошибок: {failed}, за {time.monotonic() - started:.1f} с'
+        )
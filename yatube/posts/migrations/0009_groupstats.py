@@ -0,0 +1,46 @@
+# Generated by Django 2.2.19 on 2026-10-19 07:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.expressions
+
+
+def create_group_stats(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    GroupStats.objects.bulk_create(
+        GroupStats(group_id=pk)
+        for pk in Group.objects.values_list('pk', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_auto_20221018_0708'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group', verbose_name='Группа')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Количество постов')),
+                ('last_activity', models.DateTimeField(blank=True, null=True, verbose_name='Последняя активность')),
+                ('is_dirty', models.BooleanField(default=True, verbose_name='Требует пересчёта')),
+            ],
+            options={
+                'verbose_name': 'Статистика группы',
+                'ordering': (django.db.models.expressions.OrderBy(django.db.models.expressions.F('last_activity'), descending=True, nulls_last=True), '-posts_count'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='groupstats',
+            index=models.Index(fields=['-last_activity', '-posts_count'], name='posts_groupstats_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupstats',
+            index=models.Index(fields=['is_dirty'], name='posts_groupstats_dirty_idx'),
+        ),
+        migrations.RunPython(create_group_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.19 on 2026-10-19 08:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def create_feed_states(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    FeedState = apps.get_model('posts', 'FeedState')
+    FeedState.objects.bulk_create(
+        FeedState(user_id=pk)
+        for pk in Follow.objects.values_list('user_id', flat=True).distinct()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0016_pendingdeletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='feed_state', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Последний просмотр ленты')),
+                ('unread_count', models.PositiveIntegerField(default=0, verbose_name='Непрочитанных постов')),
+            ],
+            options={
+                'verbose_name': 'Состояние ленты подписок',
+            },
+        ),
+        migrations.RunPython(
+            create_feed_states, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.19 on 2026-10-19 08:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_post_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPostRevision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='Номер версии')),
+                ('created', models.DateTimeField(verbose_name='Дата правки')),
+                ('is_snapshot', models.BooleanField(default=False, verbose_name='Полный текст')),
+                ('data', models.BinaryField(verbose_name='Данные')),
+                ('post', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='posts.ArchivedPost', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Версия архивного поста',
+                'ordering': ('number',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='archivedpostrevision',
+            constraint=models.UniqueConstraint(fields=('post', 'number'), name='unique_archived_post_revision'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrently, RemoveIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # Индекс строится конкурентно, вне транзакции, под новым именем:
+    # старый удаляется только после того, как новый готов.
+    atomic = False
+
+    dependencies = [
+        ('posts', '0024_archived_post_revisions'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='posts_post_pub_date_id_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='post',
+            name='posts_post_pub_date_idx',
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrently, RemoveIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся и удаляются конкурентно, вне транзакции. Новый
+    # индекс строится под новым именем до удаления старого, чтобы лента
+    # ни на миг не осталась без индекса.
+    atomic = False
+
+    dependencies = [
+        ('posts', '0025_post_pub_date_id_index'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='posts_post_author_pub_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='posts_post_group_pub_id_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='post',
+            name='posts_post_author_pub_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='post',
+            name='posts_post_group_pub_idx',
+        ),
+    ]
@@ -0,0 +1,118 @@
+"""Поиск почти одинаковых постов: MinHash по шинглам и LSH.
+
+Нужен numpy (см. requirements.txt).
+"""
+import hashlib
+import re
+import zlib
+
+import numpy as np
+from django.db import transaction
+
+from .models import LshBucket, PostSignature
+
+SHINGLE_SIZE = 5
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+# Оценка сходства Жаккара, начиная с которой посты считаются дублями.
+THRESHOLD = 0.8
+# Короткие тексты («Спасибо!») совпадают законно и не проверяются.
+MIN_TEXT_LENGTH = 50
+
+_random = np.random.default_rng(20221018)
+# Хеши вида (a * x + b) >> 32 по модулю 2**64 с нечётными a.
+_A = _random.integers(1, 2 ** 63, NUM_HASHES, dtype=np.uint64) | np.uint64(1)
+_B = _random.integers(0, 2 ** 63, NUM_HASHES, dtype=np.uint64)
+
+
+def shingles(text):
+    text = re.sub(r'\s+', ' ', text.lower()).strip()
+    return {
+        zlib.crc32(text[i:i + SHINGLE_SIZE].encode())
+        for i in range(max(len(text) - SHINGLE_SIZE + 1, 1))
+    }
+
+
+def signatures(texts):
+    """Сигнатуры сразу для пачки текстов: матрица len(texts) × NUM_HASHES.
+
+    Шинглы всех текстов хешируются одной операцией, минимум по каждому
+    тексту берётся через np.minimum.reduceat.
+    """
+    sets = [sorted(shingles(text)) for text in texts]
+    lengths = np.array([len(values) for values in sets])
+    values = np.fromiter(
+        (value for values in sets for value in values), dtype=np.uint64
+    )
+    with np.errstate(over='ignore'):
+        hashes = (_A[:, None] * values[None, :] + _B[:, None]) >> np.uint64(32)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return np.minimum.reduceat(hashes, starts, axis=1).T.astype(np.uint32)
+
+
+def band_keys(signature):
+    """Ключи корзин LSH: по одному на каждую полосу из ROWS хешей."""
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(
+            signature[band * ROWS:(band + 1) * ROWS].tobytes(),
+            digest_size=8,
+            person=band.to_bytes(2, 'little'),
+        ).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def similarity(first, second):
+    return float(np.mean(first == second))
+
+
+def is_checked(text):
+    return len(text) >= MIN_TEXT_LENGTH
+
+
+def find_duplicates(text, exclude=None):
+    """id постов, почти совпадающих с текстом.
+
+    Кандидаты берутся по индексу корзин LSH, затем сходство уточняется
+    по сохранённым сигнатурам.
+    """
+    if not is_checked(text):
+        return []
+    signature = signatures([text])[0]
+    candidates = LshBucket.objects.filter(
+        key__in=band_keys(signature)
+    ).values('post_id')
+    if exclude is not None:
+        candidates = candidates.exclude(post_id=exclude)
+    return [
+        post_id for post_id, stored in PostSignature.objects.filter(
+            post_id__in=candidates
+        ).values_list('post_id', 'signature')
+        if similarity(signature, np.frombuffer(stored, np.uint32))
+        >= THRESHOLD
+    ]
+
+
+def index_posts(posts):
+    """Сохраняет сигнатуры и корзины для пачки постов (id, текст)."""
+    posts = list(posts)
+    stale = [pk for pk, _ in posts]
+    posts = [(pk, text) for pk, text in posts if is_checked(text)]
+    ids = [pk for pk, _ in posts]
+    with transaction.atomic():
+        PostSignature.objects.filter(post_id__in=stale).delete()
+        LshBucket.objects.filter(post_id__in=stale).delete()
+        if not posts:
+            return
+        matrix = signatures([text for _, text in posts])
+        PostSignature.objects.bulk_create(
+            PostSignature(post_id=pk, signature=row.tobytes())
+            for pk, row in zip(ids, matrix)
+        )
+        LshBucket.objects.bulk_create(
+            (LshBucket(key=key, post_id=pk)
+             for pk, row in zip(ids, matrix) for key in band_keys(row)),
+            batch_size=1000,
+        )
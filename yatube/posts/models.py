@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from core.models import CreatedModel
 from django.db.models import UniqueConstraint
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -24,6 +25,50 @@ class Group(models.Model):
         return self.title
 
 
+class GroupStats(models.Model):
+    """Агрегаты активности группы, пересчитываются периодической задачей."""
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Группа'
+    )
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0
+    )
+    last_activity = models.DateTimeField(
+        'Последняя активность',
+        blank=True,
+        null=True
+    )
+    is_dirty = models.BooleanField(
+        'Требует пересчёта',
+        default=True
+    )
+
+    class Meta:
+        ordering = (
+            models.F('last_activity').desc(nulls_last=True),
+            '-posts_count',
+        )
+        indexes = [
+            models.Index(
+                fields=['-last_activity', '-posts_count'],
+                name='posts_groupstats_rank_idx'
+            ),
+            models.Index(
+                fields=['is_dirty'],
+                name='posts_groupstats_dirty_idx'
+            ),
+        ]
+        verbose_name = 'Статистика группы'
+
+    def __str__(self):
+        return str(self.group)
+
+
 class Post(CreatedModel):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -33,7 +78,8 @@ class Post(CreatedModel):
         User,
         on_delete=models.CASCADE,
         related_name='posts',
-        verbose_name='Автор'
+        verbose_name='Автор',
+        db_index=False
     )
     group = models.ForeignKey(
         Group,
@@ -42,23 +88,87 @@ class Post(CreatedModel):
         blank=True,
         null=True,
         verbose_name='Группа',
-        help_text='Группа, к которой будет относиться пост'
+        help_text='Группа, к которой будет относиться пост',
+        db_index=False
     )
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0
+    )
+    views = models.PositiveIntegerField('Просмотры', default=0)
+    last_comment = models.ForeignKey(
+        'Comment',
+        on_delete=models.SET_NULL,
+        related_name='+',
+        blank=True,
+        null=True,
+        verbose_name='Последний комментарий'
+    )
+
+    class Meta(CreatedModel.Meta):
+        # Индексы повторяют фильтры и сортировку лент из posts.views;
+        # одиночные индексы по author и group покрываются составными.
+        # id в конце нужен курсору (pub_date, id) лент и первой
+        # странице, отсортированной так же.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='posts_post_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='posts_post_author_pub_id_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='posts_post_group_pub_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:SLICE_POST]
 
 
+class PostRevision(models.Model):
+    """Версия текста поста.
+
+    Каждая SNAPSHOT_EVERY-я версия хранит текст целиком, остальные —
+    сжатую правку относительно предыдущей (см. posts.revisions).
+    """
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='revisions',
+        verbose_name='Пост',
+        db_index=False
+    )
+    number = models.PositiveIntegerField('Номер версии')
+    created = models.DateTimeField('Дата правки', auto_now_add=True)
+    is_snapshot = models.BooleanField('Полный текст', default=False)
+    data = models.BinaryField('Данные')
+
+    class Meta:
+        ordering = ('number',)
+        constraints = [
+            UniqueConstraint(
+                fields=['post', 'number'],
+                name='unique_post_revision'
+            ),
+        ]
+        verbose_name = 'Версия поста'
+
+
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
-        related_name='comments'
+        related_name='comments',
+        db_index=False
     )
     author = models.ForeignKey(
         User,
@@ -76,6 +186,12 @@ class Comment(models.Model):
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Комментарий'
+        indexes = [
+            models.Index(
+                fields=['post', '-created'],
+                name='posts_comment_post_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text
@@ -86,11 +202,13 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='follower',
+        db_index=False
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='following'
+        related_name='following',
+        db_index=False
     )
 
     class Meta:
@@ -100,3 +218,402 @@ class Follow(models.Model):
                 name='unique_following'
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='posts_follow_author_user_idx'
+            ),
+        ]
+
+
+class GroupSubscription(models.Model):
+    """Подписка на группу: её посты попадают в ленту подписок."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='group_subscriptions',
+        verbose_name='Пользователь',
+        db_index=False
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        related_name='subscribers',
+        verbose_name='Группа',
+        db_index=False
+    )
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'group'],
+                name='unique_group_subscription'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['group', 'user'],
+                name='posts_groupsub_group_user_idx'
+            ),
+        ]
+        verbose_name = 'Подписка на группу'
+
+
+class FeedState(models.Model):
+    """Позиция чтения ленты подписок и число непрочитанных постов.
+
+    Счётчик увеличивается одним UPDATE при публикации поста автором,
+    на которого подписан пользователь, и сбрасывается при просмотре.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='feed_state',
+        verbose_name='Пользователь'
+    )
+    last_seen = models.DateTimeField(
+        'Последний просмотр ленты', default=timezone.now
+    )
+    unread_count = models.PositiveIntegerField(
+        'Непрочитанных постов', default=0
+    )
+
+    class Meta:
+        verbose_name = 'Состояние ленты подписок'
+
+
+class Tag(models.Model):
+    """Хештег из текста поста, хранится в нижнем регистре."""
+    name = models.CharField('Тег', max_length=50, unique=True)
+
+    class Meta:
+        verbose_name = 'Тег'
+
+    def __str__(self):
+        return f'#{self.name}'
+
+
+class TaggedPost(models.Model):
+    """Обратный индекс: тег → посты в порядке публикации.
+
+    pub_date копируется из поста, чтобы лента тега читалась по индексу
+    (tag, -pub_date) без соединения с posts_post.
+    """
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='links',
+        verbose_name='Тег',
+        db_index=False
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='tag_links',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['tag', 'post'],
+                name='unique_tagged_post'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['tag', '-pub_date', '-id'],
+                name='posts_taggedpost_feed_idx'
+            ),
+        ]
+        verbose_name = 'Пост с тегом'
+
+
+class Mention(models.Model):
+    """Упоминание пользователя через @имя в тексте поста."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='mentions',
+        verbose_name='Пользователь',
+        db_index=False
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='mentions',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+    is_seen = models.BooleanField('Просмотрено', default=False)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_mention'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-id'],
+                name='posts_mention_feed_idx'
+            ),
+            models.Index(
+                fields=['user', 'is_seen'],
+                name='posts_mention_unseen_idx'
+            ),
+        ]
+        verbose_name = 'Упоминание'
+
+
+class Suggestion(models.Model):
+    """Рекомендованный автор «на кого подписаться», считается командой
+    recommend_authors."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='suggestions',
+        verbose_name='Пользователь',
+        db_index=False
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    rank = models.PositiveSmallIntegerField('Место')
+    score = models.FloatField('Оценка')
+
+    class Meta:
+        ordering = ('rank',)
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'rank'],
+                name='unique_suggestion_rank'
+            ),
+        ]
+        verbose_name = 'Рекомендация автора'
+
+
+class PostSignature(models.Model):
+    """MinHash-сигнатура текста поста для поиска почти одинаковых постов."""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+        verbose_name='Пост'
+    )
+    signature = models.BinaryField('Сигнатура')
+
+    class Meta:
+        verbose_name = 'Сигнатура поста'
+
+
+class LshBucket(models.Model):
+    """Корзина LSH: посты с совпадающей полосой сигнатуры."""
+    key = models.BigIntegerField('Ключ полосы', db_index=True)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Пост'
+    )
+
+    class Meta:
+        verbose_name = 'Корзина LSH'
+
+
+class PostScore(models.Model):
+    """Материализованный рейтинг поста для ленты «Популярное».
+
+    score хранится в логарифмической шкале: log(sum(w * exp(t / tau))).
+    Все посты затухают с одной скоростью, поэтому порядок по score
+    совпадает с порядком по затухающему рейтингу и его не нужно
+    пересчитывать со временем.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending',
+        verbose_name='Пост'
+    )
+    score = models.FloatField('Рейтинг')
+    last_activity = models.DateTimeField('Последняя активность')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], name='posts_postscore_score_idx'),
+            models.Index(
+                fields=['last_activity'],
+                name='posts_postscore_activity_idx'
+            ),
+        ]
+        verbose_name = 'Рейтинг поста'
+
+
+class JobCheckpoint(models.Model):
+    """Позиция, до которой периодическая задача уже обработала данные."""
+    name = models.CharField('Задача', max_length=50, unique=True)
+    position = models.BigIntegerField('Последний обработанный id', default=0)
+    updated = models.DateTimeField('Обновлено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Контрольная точка задачи'
+
+    def __str__(self):
+        return f'{self.name}: {self.position}'
+
+
+class ArchivedPost(models.Model):
+    """Холодная копия старого поста; id совпадает с id исходного поста.
+
+    Последний комментарий не хранится: карточка архивного поста
+    показывает только их количество.
+    """
+    is_archived = True
+
+    id = models.IntegerField(primary_key=True)
+    pub_date = models.DateTimeField('Дата')
+    text = models.TextField('Текст поста')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts',
+        verbose_name='Автор',
+        db_index=False
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        related_name='archived_posts',
+        blank=True,
+        null=True,
+        verbose_name='Группа',
+        db_index=False
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/',
+        blank=True
+    )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0
+    )
+    views = models.PositiveIntegerField('Просмотры', default=0)
+    archived = models.DateTimeField('Дата архивации', auto_now_add=True)
+
+    class Meta:
+        ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='posts_archpost_author_pub_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date'],
+                name='posts_archpost_group_pub_idx'
+            ),
+        ]
+        verbose_name = 'Архивный пост'
+
+    def __str__(self):
+        return self.text[:SLICE_POST]
+
+
+class ArchivedComment(models.Model):
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name='comments',
+        db_index=False
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_comments'
+    )
+    text = models.TextField('Текст комментария')
+    created = models.DateTimeField('Дата комментария')
+
+    class Meta:
+        ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['post', '-created'],
+                name='posts_archcomm_post_cr_idx'
+            ),
+        ]
+        verbose_name = 'Архивный комментарий'
+
+    def __str__(self):
+        return self.text
+
+
+class ArchivedPostRevision(models.Model):
+    """Версия текста архивного поста, копия PostRevision."""
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name='revisions',
+        verbose_name='Пост',
+        db_index=False
+    )
+    number = models.PositiveIntegerField('Номер версии')
+    created = models.DateTimeField('Дата правки')
+    is_snapshot = models.BooleanField('Полный текст', default=False)
+    data = models.BinaryField('Данные')
+
+    class Meta:
+        ordering = ('number',)
+        constraints = [
+            UniqueConstraint(
+                fields=['post', 'number'],
+                name='unique_archived_post_revision'
+            ),
+        ]
+        verbose_name = 'Версия архивного поста'
+
+
+class PendingDeletion(models.Model):
+    """Пользователь или группа, которые удаляются в фоне пачками."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='pending_deletion',
+        blank=True,
+        null=True,
+        verbose_name='Пользователь'
+    )
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        related_name='pending_deletion',
+        blank=True,
+        null=True,
+        verbose_name='Группа'
+    )
+    created = models.DateTimeField('Дата запроса', auto_now_add=True)
+
+    class Meta:
+        ordering = ('created',)
+        constraints = [
+            models.CheckConstraint(
+                check=(
+                    models.Q(user__isnull=False, group__isnull=True)
+                    | models.Q(user__isnull=True, group__isnull=False)
+                ),
+                name='pending_deletion_target'
+            ),
+        ]
+        verbose_name = 'Отложенное удаление'
+
+    def __str__(self):
+        return str(self.user or self.group)
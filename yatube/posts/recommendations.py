@@ -0,0 +1,115 @@
+"""Рекомендации «на кого подписаться» по графу подписок.
+
+Нужны numpy и scipy (см. requirements.txt); модуль импортируется
+только командой recommend_authors.
+"""
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from .models import Follow, Suggestion
+
+FRIENDS_OF_FRIENDS_WEIGHT = 1.0
+CO_FOLLOWED_WEIGHT = 0.5
+# Пользователи с большим числом подписок почти ничего не говорят о
+# похожести авторов, а в матрицу совместных подписок дают k² элементов.
+MAX_FOLLOWS_FOR_CO_FOLLOW = 1000
+
+
+def load_graph(chunk_size=100000):
+    """Матрица подписок пользователь × пользователь и исходные id.
+
+    id пользователей сжимаются в индексы 0..n-1.
+    """
+    edges = Follow.objects.filter(
+        user__is_active=True, author__is_active=True
+    ).order_by().values_list('user_id', 'author_id')
+    pairs = np.fromiter(
+        (value for edge in edges.iterator(chunk_size=chunk_size)
+         for value in edge),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    ids, indices = np.unique(pairs, return_inverse=True)
+    indices = indices.reshape(-1, 2)
+    size = len(ids)
+    follows = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32),
+         (indices[:, 0], indices[:, 1])),
+        shape=(size, size),
+    )
+    return ids, follows
+
+
+def co_follow_matrix(follows):
+    """Автор × автор: сколько пользователей подписаны на обоих."""
+    degrees = np.diff(follows.indptr)
+    keep = sparse.diags(
+        (degrees <= MAX_FOLLOWS_FOR_CO_FOLLOW).astype(np.float32)
+    )
+    capped = keep @ follows
+    co_follow = (capped.T @ capped).tocsr()
+    co_follow.setdiag(0)
+    co_follow.eliminate_zeros()
+    return co_follow
+
+
+def top_k(scores, follows, offset, k):
+    """Лучшие k столбцов каждой строки, кроме себя и уже подписанных."""
+    rows = np.arange(scores.shape[0])
+    itself = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, offset + rows)),
+        shape=scores.shape,
+    )
+    scores = scores.tocsr()
+    scores = scores - scores.multiply((follows + itself) > 0)
+    scores.eliminate_zeros()
+    for row in range(scores.shape[0]):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        columns = scores.indices[start:end]
+        values = scores.data[start:end]
+        if len(values) > k:
+            best = np.argpartition(-values, k)[:k]
+            columns, values = columns[best], values[best]
+        order = np.lexsort((columns, -values))
+        yield row, columns[order], values[order]
+
+
+def recommend_authors(k=10, block_size=2000):
+    """Пересчитывает рекомендации для всех пользователей с подписками.
+
+    Строки матрицы обрабатываются блоками: память ограничена размером
+    блока, а результаты каждого блока сохраняются в своей транзакции.
+    Возвращает число пользователей, для которых есть рекомендации.
+    """
+    ids, follows = load_graph()
+    if not len(ids):
+        Suggestion.objects.all().delete()
+        return 0
+    co_follow = co_follow_matrix(follows)
+    users = 0
+    for offset in range(0, len(ids), block_size):
+        block = follows[offset:offset + block_size]
+        scores = (
+            FRIENDS_OF_FRIENDS_WEIGHT * (block @ follows)
+            + CO_FOLLOWED_WEIGHT * (block @ co_follow)
+        )
+        suggestions = []
+        for row, columns, values in top_k(scores, block, offset, k):
+            suggestions.extend(
+                Suggestion(
+                    user_id=int(ids[offset + row]),
+                    author_id=int(ids[column]),
+                    rank=rank,
+                    score=float(value),
+                )
+                for rank, (column, value) in enumerate(zip(columns, values))
+            )
+        block_ids = [int(pk) for pk in ids[offset:offset + block_size]]
+        with transaction.atomic():
+            Suggestion.objects.filter(user_id__in=block_ids).delete()
+            Suggestion.objects.bulk_create(suggestions, batch_size=1000)
+        users += len({suggestion.user_id for suggestion in suggestions})
+    Suggestion.objects.exclude(
+        user_id__in=Follow.objects.values('user_id')
+    ).delete()
+    return users
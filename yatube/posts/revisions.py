@@ -0,0 +1,116 @@
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Post, PostRevision
+
+SNAPSHOT_EVERY = 10
+TOKEN_RE = re.compile(r'\s+|\w+|[^\w\s]')
+
+
+def tokenize(text):
+    """Слова, пробелы и знаки препинания; ''.join() вернёт исходный текст."""
+    return TOKEN_RE.findall(text)
+
+
+def make_delta(old, new):
+    """Правка old → new: список операций, сжатый zlib.
+
+    [n] — взять n токенов старого текста, [-n] — пропустить n токенов,
+    "строка" — вставить её.
+    """
+    old_tokens, new_tokens = tokenize(old), tokenize(new)
+    ops = []
+    matcher = SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(''.join(new_tokens[j1:j2]))
+    return zlib.compress(
+        json.dumps(ops, ensure_ascii=False, separators=(',', ':')).encode()
+    )
+
+
+def apply_delta(old, data):
+    tokens = tokenize(old)
+    position = 0
+    parts = []
+    for op in json.loads(zlib.decompress(data)):
+        if isinstance(op, str):
+            parts.append(op)
+        elif op > 0:
+            parts.extend(tokens[position:position + op])
+            position += op
+        else:
+            position -= op
+    return ''.join(parts)
+
+
+def _snapshot_number(number):
+    return (number - 1) // SNAPSHOT_EVERY * SNAPSHOT_EVERY + 1
+
+
+def text_at(post, number):
+    """Текст версии number: ближайший снимок и не больше
+    SNAPSHOT_EVERY - 1 правок, прочитанные одним запросом.
+
+    post — Post или ArchivedPost: история архивного поста хранится
+    в ArchivedPostRevision в том же виде.
+    """
+    revisions = list(
+        post.revisions.filter(
+            number__gte=_snapshot_number(number), number__lte=number
+        ).order_by('number')
+    )
+    if not revisions or revisions[-1].number != number:
+        return None
+    text = ''
+    for revision in revisions:
+        data = bytes(revision.data)
+        if revision.is_snapshot:
+            text = zlib.decompress(data).decode()
+        else:
+            text = apply_delta(text, data)
+    return text
+
+
+def record_revision(post, old_text):
+    """Сохраняет новую версию текста поста.
+
+    При первой правке прежний текст становится версией 1, чтобы
+    у постов, которые не правили, истории не было совсем. Правка
+    считается от последней сохранённой версии, а не от old_text:
+    так история не разойдётся при одновременных правках.
+    """
+    with transaction.atomic():
+        Post.objects.select_for_update().filter(pk=post.pk).exists()
+        last = post.revisions.aggregate(last=Max('number'))['last']
+        new = []
+        if last is None:
+            new.append(PostRevision(
+                post=post, number=1, is_snapshot=True,
+                data=zlib.compress(old_text.encode()),
+            ))
+            last = 1
+        else:
+            old_text = text_at(post, last)
+        number = last + 1
+        if number == _snapshot_number(number):
+            new.append(PostRevision(
+                post=post, number=number, is_snapshot=True,
+                data=zlib.compress(post.text.encode()),
+            ))
+        else:
+            new.append(PostRevision(
+                post=post, number=number,
+                data=make_delta(old_text, post.text),
+            ))
+        PostRevision.objects.bulk_create(new)
@@ -0,0 +1,195 @@
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.urls import Resolver404, resolve
+
+from core import pagecache
+
+from . import minhash
+from .counters import recount_comments, view_counter
+from .follows import recount_unread
+from .revisions import record_revision
+from .tags import index_post
+from .models import (
+    ArchivedPost, Comment, FeedState, Follow, Group, GroupStats,
+    GroupSubscription, PendingDeletion, Post, User,
+)
+
+for model in (Post, ArchivedPost, Group, User):
+    post_init.connect(pagecache.track, sender=model)
+
+
+@receiver(post_init, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    # Отложенные поля (.only(), .defer()) не читаются: обращение к ним
+    # вызвало бы refresh_from_db(), а с ним новый post_init. Пока поле
+    # не загружено, изменить его нельзя, поэтому исходным значением
+    # считается текущее (см. initial_value).
+    deferred = instance.get_deferred_fields()
+    if 'group_id' not in deferred:
+        instance._initial_group_id = instance.group_id
+    if 'text' not in deferred:
+        instance._initial_text = instance.text
+
+
+def initial_value(instance, field):
+    """Значение поля при загрузке объекта, см. remember_group."""
+    try:
+        return getattr(instance, f'_initial_{field}')
+    except AttributeError:
+        return getattr(instance, field)
+
+
+@receiver(post_save, sender=Group)
+def create_group_stats(sender, instance, created, **kwargs):
+    if created:
+        GroupStats.objects.get_or_create(group=instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, **kwargs):
+    pagecache.purge(
+        pagecache.tag_for(instance),
+        'posts.post',
+        f'auth.user:{instance.author_id}',
+        *(f'posts.group:{group_id}' for group_id in {
+            instance.group_id, initial_value(instance, 'group_id')
+        } - {None}),
+    )
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def mark_group_stats_dirty(sender, instance, **kwargs):
+    group_ids = {
+        instance.group_id, initial_value(instance, 'group_id')
+    } - {None}
+    if group_ids:
+        GroupStats.objects.filter(
+            group_id__in=group_ids, is_dirty=False
+        ).update(is_dirty=True)
+    instance._initial_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1,
+            last_comment=instance,
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    # Пересчёт, а не вычитание: комментарии автора в очереди на удаление
+    # уже исключены из счётчика в schedule_deletion.
+    recount_comments(Post.objects.filter(pk=instance.post_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def purge_group_pages(sender, instance, **kwargs):
+    pagecache.purge(pagecache.tag_for(instance), 'posts.group')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=ArchivedPost)
+def purge_instance_pages(sender, instance, **kwargs):
+    pagecache.purge(pagecache.tag_for(instance))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_comment_pages(sender, instance, **kwargs):
+    pagecache.purge(f'posts.post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def purge_follow_pages(sender, instance, **kwargs):
+    pagecache.purge(
+        f'auth.user:{instance.user_id}', f'auth.user:{instance.author_id}'
+    )
+
+
+@receiver(post_save, sender=PendingDeletion)
+def purge_deleted_pages(sender, instance, **kwargs):
+    if instance.user_id:
+        pagecache.purge(f'auth.user:{instance.user_id}', 'posts.post')
+    else:
+        pagecache.purge(f'posts.group:{instance.group_id}', 'posts.group')
+
+
+def followers_states(post):
+    """Состояния лент, в которые попадает пост: подписчиков автора
+    и подписчиков его группы."""
+    readers = Q(
+        user__in=Follow.objects.filter(author_id=post.author_id).values('user')
+    )
+    if post.group_id is not None:
+        readers |= Q(
+            user__in=GroupSubscription.objects.filter(
+                group_id=post.group_id
+            ).values('user')
+        )
+    return FeedState.objects.filter(readers)
+
+
+@receiver(post_save, sender=Post)
+def count_unread_post(sender, instance, created, **kwargs):
+    if created:
+        followers_states(instance).update(
+            unread_count=F('unread_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Post)
+def uncount_unread_post(sender, instance, **kwargs):
+    followers_states(instance).filter(
+        last_seen__lt=instance.pub_date, unread_count__gt=0
+    ).update(unread_count=F('unread_count') - 1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_save, sender=GroupSubscription)
+def create_feed_state(sender, instance, created, **kwargs):
+    if created:
+        FeedState.objects.get_or_create(user_id=instance.user_id)
+        recount_unread([instance.user_id])
+
+
+@receiver(post_delete, sender=Follow)
+@receiver(post_delete, sender=GroupSubscription)
+def recount_feed_state(sender, instance, **kwargs):
+    recount_unread([instance.user_id])
+
+
+@receiver(post_save, sender=Post)
+def process_text_change(sender, instance, created, **kwargs):
+    """Сохраняет версию в истории правок, обновляет теги и MinHash.
+
+    Сохранение без смены текста (группа в админке, счётчики) сигнатуры
+    и индексы не пересчитывает.
+    """
+    old_text = initial_value(instance, 'text')
+    if not created and instance.text == old_text:
+        return
+    if not created:
+        record_revision(instance, old_text)
+    index_post(instance, created)
+    minhash.index_posts([(instance.pk, instance.text)])
+    instance._initial_text = instance.text
+
+
+@receiver(pagecache.page_served)
+def count_cached_view(sender, request, **kwargs):
+    """Страница поста из кеша тоже считается просмотром."""
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return
+    if match.view_name == 'posts:post_detail':
+        view_counter.add(match.kwargs['post_id'])
@@ -0,0 +1,141 @@
+import re
+
+from django.db import transaction
+from django.urls import reverse
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+
+from .models import Mention, Post, Tag, TaggedPost, User
+
+TAG_MAX_LENGTH = Tag._meta.get_field('name').max_length
+TAG_RE = re.compile(r'(?<![\w#])#(\w+)')
+MENTION_RE = re.compile(r'(?<![\w@])@([\w.+-]*\w)')
+LINK_RE = re.compile(f'{TAG_RE.pattern}|{MENTION_RE.pattern}')
+
+
+def extract_tags(text):
+    return {
+        tag.lower() for tag in TAG_RE.findall(text)
+        if len(tag) <= TAG_MAX_LENGTH
+    }
+
+
+def extract_mentions(text):
+    return set(MENTION_RE.findall(text))
+
+
+def index_post(post, created=False):
+    """Приводит теги и упоминания поста в соответствие с его текстом.
+
+    Меняются только разошедшиеся строки: при правке поста удаляются
+    пропавшие теги и добавляются новые. Уведомление об упоминании
+    создаётся один раз и не повторяется при следующих правках.
+    """
+    names = extract_tags(post.text)
+    current = {} if created else dict(
+        post.tag_links.values_list('tag__name', 'pk')
+    )
+    removed = [pk for name, pk in current.items() if name not in names]
+    if removed:
+        TaggedPost.objects.filter(pk__in=removed).delete()
+    added = names - set(current)
+    if added:
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in added], ignore_conflicts=True
+        )
+        TaggedPost.objects.bulk_create(
+            TaggedPost(tag_id=tag_id, post=post, pub_date=post.pub_date)
+            for tag_id in Tag.objects.filter(
+                name__in=added
+            ).values_list('pk', flat=True)
+        )
+
+    user_ids = set(
+        User.objects.filter(
+            username__in=extract_mentions(post.text)
+        ).exclude(pk=post.author_id).values_list('pk', flat=True)
+    )
+    current = set() if created else set(
+        post.mentions.values_list('user_id', flat=True)
+    )
+    if current - user_ids:
+        post.mentions.filter(user_id__in=current - user_ids).delete()
+    if user_ids - current:
+        Mention.objects.bulk_create(
+            Mention(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in user_ids - current
+        )
+
+
+def backfill(batch_size=1000):
+    """Заполняет индекс для уже существующих постов пачками.
+
+    Упоминания в старых постах сразу помечаются просмотренными, чтобы
+    не засыпать пользователей уведомлениями. Повторный запуск ничего
+    не дублирует.
+    """
+    processed = 0
+    last_pk = 0
+    while True:
+        posts = list(
+            Post.objects.filter(pk__gt=last_pk).order_by('pk').only(
+                'pk', 'text', 'author_id', 'pub_date'
+            )[:batch_size]
+        )
+        if not posts:
+            return processed
+        last_pk = posts[-1].pk
+        tags = {post.pk: extract_tags(post.text) for post in posts}
+        names = set().union(*tags.values())
+        Tag.objects.bulk_create(
+            [Tag(name=name) for name in names], ignore_conflicts=True
+        )
+        tag_ids = dict(
+            Tag.objects.filter(name__in=names).values_list('name', 'pk')
+        )
+        mentions = {post.pk: extract_mentions(post.text) for post in posts}
+        user_ids = dict(
+            User.objects.filter(
+                username__in=set().union(*mentions.values())
+            ).values_list('username', 'pk')
+        )
+        with transaction.atomic():
+            TaggedPost.objects.bulk_create([
+                TaggedPost(
+                    tag_id=tag_ids[name], post=post, pub_date=post.pub_date
+                )
+                for post in posts for name in tags[post.pk]
+            ], ignore_conflicts=True)
+            Mention.objects.bulk_create([
+                Mention(
+                    user_id=user_ids[username], post=post,
+                    pub_date=post.pub_date, is_seen=True
+                )
+                for post in posts for username in mentions[post.pk]
+                if user_ids.get(username) not in (None, post.author_id)
+            ], ignore_conflicts=True)
+        processed += len(posts)
+
+
+def _link(match):
+    tag, username = match.groups()
+    if tag is not None:
+        if len(tag) > TAG_MAX_LENGTH:
+            return conditional_escape(match.group())
+        url = reverse('posts:tag_posts', kwargs={'name': tag.lower()})
+        return format_html('<a href="{}">#{}</a>', url, tag)
+    url = reverse('posts:profile', kwargs={'username': username})
+    return format_html('<a href="{}">@{}</a>', url, username)
+
+
+def linkify(text):
+    """Экранирует текст и превращает #теги и @имена в ссылки."""
+    text = str(text)
+    parts = []
+    position = 0
+    for match in LINK_RE.finditer(text):
+        parts.append(conditional_escape(text[position:match.start()]))
+        parts.append(_link(match))
+        position = match.end()
+    parts.append(conditional_escape(text[position:]))
+    return mark_safe(''.join(parts))
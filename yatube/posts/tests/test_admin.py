@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ..admin import IndexedDatesQuerySet
+from ..models import Comment, Follow, Group, Post, User
+
+
+class PostAdminTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'
+        )
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test-slug',
+            description='Test description'
+        )
+
+    def setUp(self):
+        self.admin_client = Client()
+        self.admin_client.force_login(self.admin)
+
+    def create_posts(self, count):
+        for i in range(count):
+            author = User.objects.create(
+                username=f'author{User.objects.count()}'
+            )
+            post = Post.objects.create(
+                text='Text', author=author, group=self.group
+            )
+            Comment.objects.create(text='Comment', post=post, author=author)
+            Follow.objects.create(user=self.admin, author=author)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.admin_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_changelist_queries_do_not_grow(self):
+        """Число запросов списка в админке не зависит от числа строк."""
+        for model in ('post', 'comment', 'follow'):
+            with self.subTest(model=model):
+                url = reverse(f'admin:posts_{model}_changelist')
+                self.create_posts(1)
+                few = self.count_queries(url)
+                self.create_posts(5)
+                self.assertEqual(self.count_queries(url), few)
+
+    def test_indexed_dates(self):
+        """dates() по индексу совпадает со стандартным DISTINCT."""
+        self.create_posts(4)
+        for pk, year, month in zip(
+            Post.objects.values_list('pk', flat=True),
+            (2020, 2020, 2021, 2022),
+            (3, 5, 5, 1),
+        ):
+            Post.objects.filter(pk=pk).update(
+                pub_date=timezone.make_aware(datetime(year, month, 10))
+            )
+        indexed = IndexedDatesQuerySet(Post)
+        for kind in ('year', 'month', 'day'):
+            with self.subTest(kind=kind):
+                self.assertEqual(
+                    indexed.dates('pub_date', kind),
+                    list(Post.objects.dates('pub_date', kind)),
+                )
@@ -0,0 +1,477 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import (
+    LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ..jobs import refresh_group_stats, schedule_deletion
+from ..models import (
+    ArchivedPost, Comment, Follow, Group, Mention, Post, Suggestion, Tag,
+    TaggedPost, User
+)
+from ..revisions import text_at
+from ..warmup import paths_from_log
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+class TempMediaMixin:
+    """Подменяет MEDIA_ROOT временным каталогом на время класса тестов."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class MediaGCTest(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='noname')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test-slug',
+            description='Test description'
+        )
+
+    def setUp(self):
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Text',
+            group=self.group,
+            image=SimpleUploadedFile(
+                name='small.gif',
+                content=SMALL_GIF,
+                content_type='image/gif'
+            ),
+        )
+        self.orphan = default_storage.save(
+            'posts/orphan.gif', ContentFile(SMALL_GIF)
+        )
+        self.orphan_thumbnail = default_storage.save(
+            'cache/ab/cd/orphan.jpg', ContentFile(SMALL_GIF)
+        )
+
+    def run_gc(self, **options):
+        out = StringIO()
+        call_command('media_gc', min_age=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_dry_run(self):
+        """В режиме dry-run файлы не удаляются, но объём считается."""
+        output = self.run_gc(dry_run=True)
+        self.assertIn(f'Можно освободить {len(SMALL_GIF) * 2} байт', output)
+        self.assertTrue(default_storage.exists(self.orphan))
+        self.assertTrue(default_storage.exists(self.orphan_thumbnail))
+
+    def test_delete_orphans(self):
+        """Удаляются только файлы, на которые никто не ссылается."""
+        self.run_gc()
+        self.assertFalse(default_storage.exists(self.orphan))
+        self.assertFalse(default_storage.exists(self.orphan_thumbnail))
+        self.assertTrue(
+            default_storage.exists(self.post.image.name)
+        )
+
+
+class ArchivePostsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='noname')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test-slug',
+            description='Test description'
+        )
+
+    def setUp(self):
+        self.old_post = Post.objects.create(
+            author=self.user, text='Old post', group=self.group
+        )
+        Comment.objects.create(
+            post=self.old_post, author=self.user, text='Old comment'
+        )
+        Post.objects.filter(pk=self.old_post.pk).update(
+            pub_date=timezone.now() - timedelta(days=400)
+        )
+        self.new_post = Post.objects.create(
+            author=self.user, text='New post', group=self.group
+        )
+
+    def test_archive_moves_old_posts(self):
+        """Старый пост с комментариями переезжает в архив с тем же id."""
+        call_command('archive_posts', days=365, stdout=StringIO())
+        self.assertFalse(Post.objects.filter(pk=self.old_post.pk).exists())
+        self.assertFalse(Comment.objects.filter(text='Old comment').exists())
+        archived = ArchivedPost.objects.get(pk=self.old_post.pk)
+        self.assertEqual(archived.comments.get().text, 'Old comment')
+        self.assertEqual(archived.comments_count, 1)
+        self.assertTrue(Post.objects.filter(pk=self.new_post.pk).exists())
+
+    def test_archive_drops_tag_index(self):
+        """Теги и упоминания архивного поста удаляются, новые остаются."""
+        reader = User.objects.create_user(username='reader')
+        old_post, new_post = (
+            Post.objects.create(author=self.user, text=f'{text} #tag @reader')
+            for text in ('Old', 'New')
+        )
+        Post.objects.filter(pk=old_post.pk).update(
+            pub_date=timezone.now() - timedelta(days=400)
+        )
+        call_command('archive_posts', days=365, stdout=StringIO())
+        self.assertEqual(
+            list(TaggedPost.objects.values_list('post', flat=True)),
+            [new_post.pk],
+        )
+        self.assertEqual(
+            list(reader.mentions.values_list('post', flat=True)),
+            [new_post.pk],
+        )
+        self.assertTrue(Tag.objects.filter(name='tag').exists())
+
+    def test_archive_keeps_revisions(self):
+        """История правок переезжает в архив и читается оттуда."""
+        texts = ['Old post'] + [f'Old post, правка {i}' for i in range(11)]
+        post = Post.objects.get(pk=self.old_post.pk)
+        for text in texts[1:]:
+            post.text = text
+            post.save()
+        call_command('archive_posts', days=365, stdout=StringIO())
+        archived = ArchivedPost.objects.get(pk=self.old_post.pk)
+        self.assertEqual(archived.revisions.count(), len(texts))
+        for number, text in enumerate(texts, start=1):
+            self.assertEqual(text_at(archived, number), text)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse(
+            'posts:post_revision',
+            kwargs={'post_id': archived.pk, 'number': 2},
+        ))
+        self.assertEqual(response.context['text'], texts[1])
+
+    def test_archived_posts_are_readable(self):
+        """Профиль и страница поста прозрачно читают архив."""
+        Post.objects.filter(pk=self.old_post.pk).update(views=7)
+        call_command('archive_posts', days=365, stdout=StringIO())
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': self.user.username})
+        )
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['New post', 'Old post'],
+        )
+        self.assertContains(response, 'Просмотров: 7')
+        self.assertContains(response, 'Комментариев: 1')
+        self.assertNotContains(response, 'Old comment')
+        self.assertEqual(response.context['posts_total'], 2)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.old_post.pk})
+        )
+        self.assertTrue(response.context['is_archived'])
+        self.assertContains(response, 'Old comment')
+
+
+class ProcessDeletionsTest(TempMediaMixin, TransactionTestCase):
+    """Файлы удаляются в on_commit, поэтому нужны настоящие коммиты."""
+
+    def setUp(self):
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Test group',
+            slug='test-slug',
+            description='Test description'
+        )
+        self.user = User.objects.create_user(username='noname')
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Text',
+            group=self.group,
+            image=SimpleUploadedFile(
+                name='small.gif',
+                content=SMALL_GIF,
+                content_type='image/gif'
+            ),
+        )
+        Comment.objects.create(post=self.post, author=self.reader, text='C')
+        Follow.objects.create(user=self.reader, author=self.user)
+
+    def test_scheduled_user_is_hidden(self):
+        """Контент пользователя скрывается сразу после постановки в очередь."""
+        schedule_deletion(self.user)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': self.user.username})
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_scheduled_comment_leaves_card(self):
+        """Комментарий из очереди на удаление пропадает с карточки поста."""
+        Comment.objects.create(post=self.post, author=self.user, text='Kept')
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Hidden'
+        )
+        schedule_deletion(self.reader)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(self.post.last_comment.text, 'Kept')
+        caches['template_fragments'].clear()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Kept')
+        self.assertNotContains(response, 'Hidden')
+        call_command('process_deletions', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+    def test_process_deletions(self):
+        """Пользователь, его строки и картинки удаляются пачками."""
+        image = self.post.image.name
+        schedule_deletion(self.user)
+        schedule_deletion(self.group)
+        call_command('process_deletions', batch_size=1, stdout=StringIO())
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Group.objects.filter(pk=self.group.pk).exists())
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(default_storage.exists(image))
+
+
+class WarmCachesTest(TempMediaMixin, LiveServerTestCase):
+    """Страницы запрашиваются по HTTP, поэтому нужен живой сервер."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='noname')
+        self.group = Group.objects.create(
+            title='Test group',
+            slug='test-slug',
+            description='Test description'
+        )
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Text',
+            group=self.group,
+            image=SimpleUploadedFile(
+                name='small.gif',
+                content=SMALL_GIF,
+                content_type='image/gif'
+            ),
+        )
+        refresh_group_stats()
+
+    def test_warm_caches(self):
+        """Создаются миниатюры и запрашиваются популярные страницы."""
+        out = StringIO()
+        call_command(
+            'warm_caches', base_url=self.live_server_url, workers=2,
+            stdout=out
+        )
+        output = out.getvalue()
+        self.assertIn('ok', output)
+        self.assertIn('200', output)
+        self.assertIn(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            output
+        )
+        self.assertIn('ошибок: 0', output)
+
+    def test_paths_from_log(self):
+        """Из журнала берутся самые частые успешные GET-запросы."""
+        lines = [
+            '1.2.3.4 - - [01/Jan/2024] "GET /group/a/ HTTP/1.1" 200 512',
+            '1.2.3.4 - - [01/Jan/2024] "GET / HTTP/1.1" 200 512',
+            '1.2.3.4 - - [01/Jan/2024] "GET /group/a/ HTTP/1.1" 200 512',
+            '1.2.3.4 - - [01/Jan/2024] "GET /missing/ HTTP/1.1" 404 0',
+            '/profile/noname/ 5',
+        ]
+        self.assertEqual(
+            paths_from_log(lines, 2), ['/profile/noname/', '/group/a/']
+        )
+
+
+class ImportFollowsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = [
+            User.objects.create_user(username=f'user{i}') for i in range(3)
+        ]
+
+    def test_import_and_unfollow(self):
+        """Подписки импортируются пачками, неизвестные имена пропускаются."""
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as source:
+            source.write(
+                'user0,user1\nuser0,user2\nuser1,user2\n'
+                'user1,unknown\nuser0,user1\n'
+            )
+            source.flush()
+            out = StringIO()
+            call_command('import_follows', source.name, batch_size=2,
+                         stdout=out)
+            self.assertIn('пропущено: 1', out.getvalue())
+            self.assertEqual(Follow.objects.count(), 3)
+            call_command('import_follows', source.name, unfollow=True,
+                         stdout=StringIO())
+        self.assertFalse(Follow.objects.exists())
+
+
+class RecommendAuthorsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = [
+            User.objects.create_user(username=f'user{i}') for i in range(5)
+        ]
+        for user, author in ((0, 1), (1, 2), (3, 1), (3, 4), (1, 0)):
+            Follow.objects.create(
+                user=cls.users[user], author=cls.users[author]
+            )
+
+    def test_recommendations(self):
+        """Друзья друзей и совместные подписки без себя и уже подписанных."""
+        call_command('recommend_authors', k=5, stdout=StringIO())
+        suggested = list(
+            Suggestion.objects.filter(user=self.users[0]).values_list(
+                'author__username', flat=True
+            )
+        )
+        self.assertEqual(suggested, ['user2', 'user4'])
+        self.client.force_login(self.users[0])
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertContains(response, '@user2')
+
+
+class DetectDuplicatesTest(TestCase):
+    SPAM = 'Лучшие цены на всё! Переходите по ссылке и получите скидку {}%'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='noname')
+        cls.spam = [
+            Post.objects.create(author=cls.user, text=cls.SPAM.format(i))
+            for i in (10, 20, 30)
+        ]
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Совсем другой, вполне обычный и достаточно длинный пост.'
+        )
+
+    def test_post_create_rejects_duplicate(self):
+        """Форма не пропускает почти такой же текст."""
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': self.SPAM.format(40)}
+        )
+        self.assertFormError(
+            response, 'form', 'text', 'Почти такой же пост уже опубликован.'
+        )
+        self.assertEqual(Post.objects.count(), 4)
+
+    def test_clusters(self):
+        """Команда находит группу из трёх почти одинаковых постов."""
+        out = StringIO()
+        call_command('detect_duplicates', stdout=out)
+        self.assertIn(
+            '3 постов, авторов: 1: '
+            + ', '.join(str(post.pk) for post in self.spam),
+            out.getvalue()
+        )
+        self.assertIn('Групп дубликатов: 1', out.getvalue())
+
+    def test_signature_kept_without_text_change(self):
+        """Сохранение без смены текста не пересчитывает сигнатуру."""
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = Group.objects.create(title='Group', slug='group')
+        with CaptureQueriesContext(connection) as context:
+            post.save()
+        self.assertFalse([
+            query for query in context.captured_queries
+            if 'posts_postsignature' in query['sql']
+        ])
+        post.text = self.SPAM.format(50)
+        with CaptureQueriesContext(connection) as context:
+            post.save()
+        self.assertTrue([
+            query for query in context.captured_queries
+            if 'posts_postsignature' in query['sql']
+        ])
+
+
+class IndexTagsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test-slug',
+            description='Test description'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, group=cls.group,
+                text=f'#Старый пост {i} для @reader'
+            )
+            for i in range(3)
+        ]
+        # Имитируем посты, опубликованные до появления индекса.
+        TaggedPost.objects.all().delete()
+        Mention.objects.all().delete()
+
+    def test_backfill_existing_posts(self):
+        """Команда индексирует старые посты и не дублирует строки."""
+        for _ in range(2):
+            out = StringIO()
+            call_command('index_tags', batch_size=2, stdout=out)
+            self.assertIn('Проиндексировано постов: 3', out.getvalue())
+        self.assertEqual(
+            list(Tag.objects.values_list('name', flat=True)), ['старый']
+        )
+        self.assertEqual(TaggedPost.objects.count(), len(self.posts))
+        self.assertEqual(
+            Mention.objects.filter(user=self.reader, is_seen=True).count(),
+            len(self.posts),
+        )
+
+    def test_deferred_post_fields(self):
+        """Пост с отложенными полями загружается и сохраняется."""
+        post = Post.objects.only('pk', 'text').get(pk=self.posts[0].pk)
+        post.text = '#новый текст'
+        post.save()
+        self.assertEqual(
+            list(post.tag_links.values_list('tag__name', flat=True)),
+            ['новый'],
+        )
@@ -0,0 +1,106 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..jobs import refresh_group_stats, update_trending
+from ..models import (
+    Comment, Follow, Group, GroupSubscription, Post, User
+)
+
+SQLITE_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)(.*)')
+SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY')
+
+
+def explain(sql):
+    """План запроса в виде списка строк."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql)
+            return [row[0] for row in cursor.fetchall()]
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan, allow_sort=False):
+    """Последовательные сканирования и сортировки в плане запроса."""
+    problems = []
+    for line in plan:
+        if connection.vendor == 'postgresql':
+            if 'Seq Scan' in line:
+                problems.append(line)
+            if re.search(r'\bSort\b', line) and not allow_sort:
+                problems.append(line)
+            continue
+        scan = SQLITE_SCAN.search(line)
+        # stream_N — порции ленты подписок в UNION ALL, а не таблицы.
+        if (scan and scan.group(1).upper() not in ('SUBQUERY', 'CONSTANT')
+                and not scan.group(1).startswith('stream_')
+                and 'INDEX' not in scan.group(2)):
+            problems.append(line)
+        if SQLITE_SORT.search(line) and not allow_sort:
+            problems.append(line)
+    return problems
+
+
+class QueryPlanTest(TestCase):
+    """Все запросы страниц из posts.views идут по индексам."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='noname')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test-slug',
+            description='Test description'
+        )
+        for i in range(3):
+            post = Post.objects.create(
+                text='Text #tag @noname', author=cls.author, group=cls.group
+            )
+            Comment.objects.create(text='Text', post=post, author=cls.user)
+        Follow.objects.create(user=cls.user, author=cls.author)
+        GroupSubscription.objects.create(user=cls.user, group=cls.group)
+        refresh_group_stats()
+        update_trending()
+        cls.post = post
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_views_use_indexes(self):
+        """В планах нет последовательных сканирований и сортировок."""
+        urls = {
+            reverse('posts:index'): False,
+            reverse('posts:trending'): False,
+            # Группы без постов идут в конце (NULLS LAST), а такой порядок
+            # индекс по -last_activity не даёт; каталог групп невелик.
+            reverse('posts:group_index'): True,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}):
+                False,
+            reverse('posts:profile', kwargs={'username': self.author}): False,
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}):
+                False,
+            reverse('posts:tag_posts', kwargs={'name': 'tag'}): False,
+            reverse('posts:mentions'): False,
+            reverse('posts:follow_index'): False,
+        }
+        for url, allow_sort in urls.items():
+            with CaptureQueriesContext(connection) as context:
+                self.authorized_client.get(url)
+            for query in context.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT'):
+                    continue
+                with self.subTest(url=url, sql=sql):
+                    self.assertEqual(
+                        plan_problems(explain(sql), allow_sort), []
+                    )
@@ -28,6 +28,7 @@ class PostsURLTests(TestCase):
         cls.url_404 = '/page404/'
         cls.template_for_all = {
             '/': 'posts/index.html',
+            '/group/': 'posts/group_index.html',
             f'/group/{cls.group.slug}/': 'posts/group_list.html',
             f'/profile/{cls.user.username}/': 'posts/profile.html',
             f'/posts/{cls.post.pk}/': 'posts/post_detail.html',
@@ -1,15 +1,33 @@
+import json
+import os
+import re
 import shutil
 import tempfile
 
-
 from django import forms
 from django.conf import settings
-from django.core.cache import cache
+from django.core.cache import cache, caches
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+
+from sorl.thumbnail import default, get_thumbnail
 
-from ..models import Group, Post, User, Comment, Follow
+from core import pagecache, slowqueries
+from core.paginator import EstimatedCountPaginator
+from core.ratelimit import _consume
+
+from ..counters import view_counter
+from ..jobs import refresh_group_stats, update_trending
+from ..models import (
+    Group, GroupStats, GroupSubscription, Post, User, Comment, FeedState,
+    Follow, Mention, TaggedPost
+)
+from ..revisions import text_at
+from ..thumbnails import POST_GEOMETRY, POST_OPTIONS, prefetch_thumbnails
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -73,6 +91,24 @@ class TestImagePages(TestCase):
         response = self.authorized_client.get(page)
         self.assertEqual(response.context.get('post').image, self.post.image)
 
+    def test_thumbnail_prefetch(self):
+        """Миниатюры страницы подгружаются одним запросом."""
+        caches['thumbnails'].clear()
+        thumbnail = get_thumbnail(
+            self.post.image, POST_GEOMETRY, **POST_OPTIONS
+        )
+        self.assertEqual(
+            default.backend.get_thumbnail_name(
+                self.post.image, POST_GEOMETRY, **POST_OPTIONS
+            ),
+            thumbnail.name
+        )
+        caches['thumbnails'].clear()
+        with self.assertNumQueries(1):
+            prefetch_thumbnails([self.post])
+            cached = default.kvstore.get(thumbnail)
+        self.assertEqual(cached.name, thumbnail.name)
+
 
 class PaginatorViewTest(TestCase):
     @classmethod
@@ -95,6 +131,11 @@ class PaginatorViewTest(TestCase):
             )
             for i in range(ALL_POSTS)]
 
+    def setUp(self):
+        # Анонимные страницы кешируются целиком, а context есть
+        # только у отрисованного ответа.
+        cache.clear()
+
     def test_first_page(self):
         """Тестирование первой страницы paginator"""
         response = self.client.get(reverse('posts:index'))
@@ -107,6 +148,108 @@ class PaginatorViewTest(TestCase):
             len(response.context['page_obj']), ALL_POSTS - SLICE_POSTS
         )
 
+    def test_exact_count_below_threshold(self):
+        """Ниже порога количество постов считается точно."""
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': self.user.username})
+        )
+        self.assertFalse(response.context['page_obj'].paginator.is_estimated)
+        self.assertEqual(response.context['posts_total'], ALL_POSTS)
+
+    @override_settings(PAGINATOR_COUNT_THRESHOLD=SLICE_POSTS // 2)
+    def test_estimated_count_above_threshold(self):
+        """Выше порога показывается оценка, страницы остаются доступны."""
+        url = reverse('posts:profile', kwargs={'username': self.user.username})
+        response = self.client.get(url)
+        page_obj = response.context['page_obj']
+        self.assertTrue(page_obj.paginator.is_estimated)
+        self.assertContains(response, '≈')
+        self.assertTrue(page_obj.has_next())
+        response = self.client.get(url + '?page=2')
+        self.assertEqual(
+            len(response.context['page_obj']), ALL_POSTS - SLICE_POSTS
+        )
+        self.assertFalse(response.context['page_obj'].has_next())
+
+    def test_estimate_ignored_below_threshold(self):
+        """Ошибочная оценка планировщика не заменяет точный подсчёт."""
+        class WrongEstimatePaginator(EstimatedCountPaginator):
+            def estimate_count(self, queryset):
+                return 10 ** 6
+
+        paginator = WrongEstimatePaginator(
+            Post.objects.filter(author=self.user), SLICE_POSTS
+        )
+        self.assertEqual(paginator.count, ALL_POSTS)
+        self.assertFalse(paginator.is_estimated)
+
+    def test_partial_feed(self):
+        """С ?partial=1 отдаются только карточки после курсора."""
+        for url in (
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                cursor = response.context['page_obj'].next_cursor
+                shown = {post.pk for post in response.context['page_obj']}
+                self.assertContains(response, 'js-load-more')
+                response = self.client.get(
+                    url, {'partial': 1, 'cursor': cursor}
+                )
+                self.assertNotContains(response, '<html')
+                self.assertNotContains(response, 'js-load-more')
+                loaded = {
+                    int(pk) for pk in
+                    re.findall(r'/posts/(\d+)/', response.content.decode())
+                }
+                self.assertEqual(len(loaded), ALL_POSTS - SLICE_POSTS)
+                self.assertEqual(
+                    shown | loaded, {post.pk for post in self.post}
+                )
+
+    def test_load_more_without_js(self):
+        """Ссылка «Показать ещё» открывает следующую порцию целой страницей."""
+        caches['template_fragments'].clear()
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                link = re.search(
+                    r'class="[^"]*js-load-more" href="([^"]*)"',
+                    response.content.decode()
+                ).group(1)
+                self.assertNotIn('partial', link)
+                shown = {post.pk for post in response.context['page_obj']}
+                response = self.client.get(url + link.replace('&amp;', '&'))
+                self.assertContains(response, '<html')
+                loaded = {post.pk for post in response.context['page_obj']}
+                self.assertEqual(len(loaded), ALL_POSTS - SLICE_POSTS)
+                self.assertEqual(
+                    shown | loaded, {post.pk for post in self.post}
+                )
+                self.assertContains(
+                    response, f'/posts/{min(loaded)}/'
+                )
+
+    def test_partial_feed_same_pub_date(self):
+        """Посты одной даты на стыке порций не теряются и не повторяются."""
+        Post.objects.update(pub_date=timezone.now())
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        shown = [post.pk for post in response.context['page_obj']]
+        response = self.client.get(url, {
+            'partial': 1, 'cursor': response.context['page_obj'].next_cursor
+        })
+        loaded = [post.pk for post in response.context['posts']]
+        self.assertEqual(
+            shown + loaded,
+            sorted((post.pk for post in self.post), reverse=True),
+        )
+
 
 class PostViewTest(TestCase):
     @classmethod
@@ -241,6 +384,113 @@ class PostViewTest(TestCase):
         )
 
 
+class GroupIndexTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='noname')
+        cls.quiet_group = Group.objects.create(
+            title='Quiet group',
+            slug='quiet',
+            description='Test description'
+        )
+        cls.active_group = Group.objects.create(
+            title='Active group',
+            slug='active',
+            description='Test description'
+        )
+        for group in (cls.quiet_group, cls.active_group, cls.active_group):
+            Post.objects.create(text='Text', group=group, author=cls.user)
+
+    def test_refresh_only_dirty(self):
+        """Задача пересчитывает только изменившиеся группы."""
+        self.assertEqual(refresh_group_stats(), 2)
+        self.assertEqual(refresh_group_stats(), 0)
+        post = self.quiet_group.posts.get()
+        post.group = self.active_group
+        post.save()
+        self.assertEqual(refresh_group_stats(), 2)
+        self.assertEqual(
+            GroupStats.objects.get(group=self.quiet_group).posts_count, 0
+        )
+
+    def test_group_index(self):
+        """Каталог групп не агрегирует посты во время запроса."""
+        refresh_group_stats()
+        empty_group = Group.objects.create(
+            title='Empty group',
+            slug='empty',
+            description='Test description'
+        )
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('posts:group_index'))
+        groups = [stats.group for stats in response.context['page_obj']]
+        self.assertEqual(
+            groups, [self.active_group, self.quiet_group, empty_group]
+        )
+        self.assertIsNone(response.context['page_obj'][2].last_activity)
+        self.assertEqual(response.context['page_obj'][0].posts_count, 2)
+
+
+class TrendingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='noname')
+        cls.author = User.objects.create(username='author')
+        cls.first = Post.objects.create(text='First', author=cls.author)
+        cls.second = Post.objects.create(text='Second', author=cls.author)
+        Post.objects.create(text='Quiet', author=cls.author)
+
+    def comment(self, post, count=1, author=None):
+        for i in range(count):
+            Comment.objects.create(
+                text='Text', post=post, author=author or self.user
+            )
+
+    def trending_posts(self):
+        response = self.client.get(reverse('posts:trending'))
+        return list(response.context['page_obj'])
+
+    def test_trending_order(self):
+        """Посты ранжируются по комментариям, без активности не попадают."""
+        self.comment(self.first, 3)
+        self.comment(self.second)
+        self.assertEqual(update_trending(), 4)
+        self.assertEqual(self.trending_posts(), [self.first, self.second])
+
+    def test_trending_tab_is_active(self):
+        """В переключателе лент выделена вкладка «Популярное»."""
+        cache.clear()
+        response = self.client.get(reverse('posts:trending'))
+        self.assertTrue(response.context['trending'])
+        self.assertRegex(
+            response.content.decode(),
+            r'nav-link active"\s+href="{}"'.format(
+                re.escape(reverse('posts:trending'))
+            ),
+        )
+
+    def test_incremental_update(self):
+        """Повторный запуск учитывает только новые события."""
+        self.comment(self.first)
+        update_trending()
+        self.assertEqual(update_trending(), 0)
+        self.comment(self.second, 2)
+        self.assertEqual(update_trending(), 2)
+        self.assertEqual(self.trending_posts(), [self.second, self.first])
+
+    def test_follower_comment_weight(self):
+        """Комментарий подписчика автора весит больше."""
+        self.comment(self.first, 2, author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        self.comment(self.second)
+        update_trending()
+        posts = self.trending_posts()
+        self.assertEqual(posts[0], self.second)
+        self.assertEqual(len(posts), 3)
+
+
 class ComentTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -275,6 +525,188 @@ class ComentTest(TestCase):
         self.assertEqual(obj.text, self.comment_test.text)
         self.assertEqual(obj.author, self.comment_test.author)
 
+    def test_comment_counters(self):
+        """Количество комментариев и последний из них хранятся в посте."""
+        latest = Comment.objects.create(
+            text='Latest comment',
+            post=self.post,
+            author=self.user
+        )
+        cache.clear()
+        caches['template_fragments'].clear()
+        response = self.client.get(reverse('posts:index'))
+        post = response.context['page_obj'][0]
+        self.assertEqual(post.comments_count, 2)
+        self.assertEqual(post.last_comment, latest)
+        self.assertContains(response, 'Latest comment')
+        latest.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.last_comment, self.comment_test)
+
+
+@override_settings(POSTS_TEMPLATE_ENGINE='jinja2')
+class JinjaTemplatesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='noname')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='slug',
+            description='Test description'
+        )
+        cls.post = Post.objects.create(
+            text='Jinja text', group=cls.group, author=cls.user
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_pages(self):
+        """Страницы posts отрисовываются шаблонами Jinja2."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:index') + '?partial=1',
+            reverse('posts:follow_index'),
+            reverse('posts:trending'),
+            reverse('posts:group_index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_create'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                # Сигнал template_rendered отправляет только DTL,
+                # виджеты форм по-прежнему отрисовываются им.
+                self.assertFalse([
+                    template.name for template in response.templates
+                    if not template.name.startswith('django/forms/')
+                ])
+        response = self.authorized_client.get(
+            reverse('posts:profile', kwargs={'username': self.user.username})
+        )
+        self.assertContains(response, 'Jinja text')
+        self.assertContains(response, self.group.slug)
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='noname')
+        cls.post = Post.objects.create(text='Text', author=cls.user)
+        cls.other_post = Post.objects.create(
+            text='Other', author=User.objects.create(username='other')
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )
+
+    def get_queries(self, client, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context)
+
+    def test_anonymous_hit_without_queries(self):
+        """Повторная анонимная страница отдаётся из кеша без запросов к БД."""
+        self.get_queries(self.client, self.url)
+        response, queries = self.get_queries(self.client, self.url)
+        self.assertEqual(queries, 0)
+        authorized_client = Client()
+        authorized_client.force_login(self.user)
+        response, queries = self.get_queries(authorized_client, self.url)
+        self.assertGreater(queries, 0)
+
+    def test_purge_by_dependency(self):
+        """Изменение сбрасывает только зависящие от объекта страницы."""
+        self.get_queries(self.client, self.url)
+        self.other_post.save()
+        response, queries = self.get_queries(self.client, self.url)
+        self.assertEqual(queries, 0)
+        Comment.objects.create(
+            post=self.post, author=self.user, text='New comment'
+        )
+        response, queries = self.get_queries(self.client, self.url)
+        self.assertGreater(queries, 0)
+        self.assertContains(response, 'New comment')
+
+    def test_evicted_version_does_not_revive_page(self):
+        """Версия тега, вытесненная после сброса, не оживляет страницу."""
+        self.get_queries(self.client, self.url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Edited'
+        post.save()
+        # Кеш вытесняет версии тегов, сброшенных сохранением поста.
+        cache.delete_many([
+            f'pagecache:tag:{tag}' for tag in (
+                pagecache.tag_for(post), 'posts.post',
+                pagecache.tag_for(self.user),
+            )
+        ])
+        self.get_queries(self.client, reverse(
+            'posts:profile', kwargs={'username': self.user.username}
+        ))
+        response, queries = self.get_queries(self.client, self.url)
+        self.assertGreater(queries, 0)
+        self.assertContains(response, 'Edited')
+
+
+class RateLimitTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='noname')
+        cls.post = Post.objects.create(text='Text', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    @override_settings(RATELIMITS={'add_comment': {'user': (2, 60)}})
+    def test_comment_limit(self):
+        """Сверх лимита возвращается 429 и комментарий не сохраняется."""
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.pk})
+        for i in range(2):
+            response = self.authorized_client.post(url, {'text': 'Text'})
+            self.assertEqual(response.status_code, 302)
+        # Отказ отрисовывается без контекстных процессоров: запросы
+        # к БД только за сессией и пользователем.
+        with self.assertNumQueries(2):
+            response = self.authorized_client.post(url, {'text': 'Text'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(self.post.comments.count(), 2)
+
+    def test_tokens_refill_gradually(self):
+        """За полпериода возвращается половина токенов, а не все."""
+        for i in range(4):
+            self.assertEqual(_consume('test', 4, 60), 0)
+        self.assertEqual(_consume('test', 4, 60), 15)
+        level, refilled_at = cache.get('ratelimit:test')
+        cache.set('ratelimit:test', (level, refilled_at - 30))
+        for i in range(2):
+            self.assertEqual(_consume('test', 4, 60), 0)
+        self.assertGreater(_consume('test', 4, 60), 0)
+
+    @override_settings(RATELIMITS={'signup': {'ip': (1, 60)}})
+    def test_signup_limit(self):
+        """Лимит по IP действует и для анонимной регистрации."""
+        url = reverse('users:signup')
+        self.client.post(url, {})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.post(url, {}).status_code, 429)
+
 
 class FollowTest(TestCase):
     @classmethod
@@ -341,7 +773,7 @@ class FollowTest(TestCase):
             author=self.user3,
         )
         response = self.authorized_client.get(reverse('posts:follow_index'))
-        self.assertEqual((response.context['page_obj'][0]).text, post.text)
+        self.assertEqual((response.context['posts'][0]).text, post.text)
 
     def test_no_add_post_in_follower(self):
         """Проверка того, что новая запись пользователя
@@ -354,4 +786,445 @@ class FollowTest(TestCase):
             author=self.user3,
         )
         response = self.authorized_client.get(reverse('posts:follow_index'))
-        self.assertEqual(len(response.context['page_obj']), posts)
+        self.assertEqual(len(response.context['posts']), posts)
+
+    def test_unread_count(self):
+        """Число новых постов считается при публикации и сбрасывается
+           при просмотре ленты.
+        """
+        cache.clear()
+        url = reverse('posts:follow_index')
+        Post.objects.create(text='Old', author=self.user2)
+        self.authorized_client.get(url)
+        for i in range(2):
+            Post.objects.create(text='New', author=self.user2)
+        self.assertEqual(
+            FeedState.objects.get(user=self.user).unread_count, 2
+        )
+        response = self.authorized_client.get(url)
+        self.assertEqual(response.context['unread_count'], 2)
+        self.assertEqual(response.context['first_read'], 2)
+        self.assertContains(response, 'Прочитанное ранее')
+        response = self.authorized_client.get(url)
+        self.assertEqual(response.context['unread_count'], 0)
+
+    def test_unread_count_follows_subscriptions(self):
+        """Счётчик непрочитанного пересчитывается при смене подписок."""
+        self.authorized_client.get(reverse('posts:follow_index'))
+        for i in range(2):
+            Post.objects.create(
+                text='New', group=self.group, author=self.user3
+            )
+
+        def unread():
+            return FeedState.objects.get(user=self.user).unread_count
+
+        self.assertEqual(unread(), 0)
+        self.authorized_client.post(
+            reverse('posts:follow_bulk'),
+            json.dumps({'follow': [self.user3.username]}),
+            content_type='application/json',
+        )
+        self.assertEqual(unread(), 2)
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.user3}
+        ))
+        self.assertEqual(unread(), 0)
+        self.authorized_client.get(reverse(
+            'posts:group_subscribe', kwargs={'slug': self.group.slug}
+        ))
+        self.assertEqual(unread(), 2)
+        self.authorized_client.get(reverse(
+            'posts:group_unsubscribe', kwargs={'slug': self.group.slug}
+        ))
+        self.assertEqual(unread(), 0)
+
+    def test_group_subscription_feed(self):
+        """Посты групп сливаются с постами авторов без повторов."""
+        self.authorized_client.get(reverse(
+            'posts:group_subscribe', kwargs={'slug': self.group.slug}
+        ))
+        self.assertTrue(
+            GroupSubscription.objects.filter(
+                user=self.user, group=self.group
+            ).exists()
+        )
+        both = Post.objects.create(
+            text='Both', group=self.group, author=self.user2
+        )
+        by_group = Post.objects.create(
+            text='Group', group=self.group, author=self.user3
+        )
+        self.assertEqual(
+            FeedState.objects.get(user=self.user).unread_count, 2
+        )
+        expected = [by_group, both, self.post]
+        for max_streams in (50, 0):
+            with self.subTest(max_streams=max_streams), override_settings(
+                FOLLOW_FEED_MAX_STREAMS=max_streams, SLICE_POSTS=2
+            ):
+                response = self.authorized_client.get(
+                    reverse('posts:follow_index')
+                )
+                self.assertEqual(response.context['posts'], expected[:2])
+                response = self.authorized_client.get(
+                    reverse('posts:follow_index'),
+                    {'partial': 1, 'cursor': response.context['next_cursor']}
+                )
+                self.assertEqual(response.context['posts'], expected[2:])
+
+    def test_follow_feed_queries_do_not_grow(self):
+        """Число запросов ленты не зависит от числа подписок."""
+        def follow(count):
+            for _ in range(count):
+                author = User.objects.create_user(
+                    username=f'author{User.objects.count()}'
+                )
+                Post.objects.create(author=author, text='Text')
+                Follow.objects.create(user=self.user, author=author)
+
+        def queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.authorized_client.get(reverse('posts:follow_index'))
+            return len(context)
+
+        follow(1)
+        few = queries()
+        follow(40)
+        self.assertEqual(queries(), few)
+
+    def test_follow_bulk(self):
+        """Пакетная подписка и отписка одним JSON-запросом."""
+        response = self.authorized_client.post(
+            reverse('posts:follow_bulk'),
+            json.dumps({
+                'follow': [self.user3.username, self.user2.username],
+                'unfollow': [],
+            }),
+            content_type='application/json',
+        )
+        # Подписка на user2 уже была и не считается созданной.
+        self.assertEqual(response.json(), {'followed': 1, 'unfollowed': 0})
+        self.assertEqual(Follow.objects.filter(user=self.user).count(), 2)
+        response = self.authorized_client.post(
+            reverse('posts:follow_bulk'),
+            json.dumps({'unfollow': [self.user2.username, 'unknown']}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json(), {'followed': 0, 'unfollowed': 1})
+        self.assertFalse(
+            Follow.objects.filter(user=self.user, author=self.user2).exists()
+        )
+
+    def test_follow_bulk_bad_payload(self):
+        """Поля follow и unfollow должны быть списками строк."""
+        User.objects.create_user(username='a')
+        for payload in (
+            {'follow': 'abc'},
+            {'unfollow': 'abc'},
+            {'follow': [1, 2]},
+            {'follow': {'a': 1}},
+            ['a'],
+        ):
+            with self.subTest(payload=payload):
+                response = self.authorized_client.post(
+                    reverse('posts:follow_bulk'),
+                    json.dumps(payload),
+                    content_type='application/json',
+                )
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(
+            Follow.objects.filter(user=self.user, author__username='a')
+            .exists()
+        )
+
+    def test_follow_json(self):
+        """Подписка с Accept: application/json отвечает без редиректа."""
+        response = self.authorized_client.get(
+            reverse(
+                'posts:profile_follow',
+                kwargs={'username': self.user3.username}
+            ),
+            HTTP_ACCEPT='application/json',
+        )
+        self.assertEqual(response.json(), {'following': True})
+        self.assertTrue(
+            Follow.objects.filter(user=self.user, author=self.user3).exists()
+        )
+
+
+@override_settings(VIEW_COUNTER_FLUSH_INTERVAL=60 * 60)
+class ViewCounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Просмотры из других тестов не должны попасть на новые посты.
+        view_counter.flush()
+        cls.user = User.objects.create_user(username='noname')
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=f'Text {i}')
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_views_are_flushed_in_one_update(self):
+        """Просмотры копятся в памяти и записываются одним UPDATE."""
+        for post, views in zip(self.posts, (3, 1)):
+            url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+            for _ in range(views):
+                self.client.get(url)
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list('views', flat=True)),
+            [0, 0],
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(view_counter.flush(), 2)
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list('views', flat=True)),
+            [3, 1],
+        )
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='noname')
+        Post.objects.create(author=cls.user, text='Text')
+
+    def setUp(self):
+        cache.clear()
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir, ignore_errors=True)
+
+    def test_metrics(self):
+        """Метрики всех процессов из общего каталога складываются."""
+        for pid in (1, 2):
+            with open(os.path.join(self.metrics_dir, f'{pid}.json'),
+                      'w') as output:
+                json.dump([[
+                    'yatube_responses_total',
+                    [['status', '200'], ['view', 'other']],
+                    2,
+                ]], output)
+        with override_settings(METRICS_DIR=self.metrics_dir):
+            self.client.get(reverse('posts:index'))
+            self.client.get(reverse('posts:index'))
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        for line in (
+            'yatube_responses_total{status="200",view="other"} 4',
+            'yatube_view_duration_seconds_bucket'
+            '{le="+Inf",method="GET",view="posts:index"}',
+            'yatube_db_queries_total{view="posts:index"}',
+            'yatube_cache_requests_total{cache="pages",result="hit"}',
+            'yatube_job_queue_depth{queue="deletions"} 0',
+        ):
+            with self.subTest(line=line):
+                self.assertContains(response, line)
+
+    def test_metrics_are_private(self):
+        """Метрики отдаются только с разрешённых адресов."""
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='10.0.0.1'
+        )
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """С токеном адрес не важен, без него не помогает и localhost."""
+        url = reverse('metrics')
+        for remote_addr, authorization, status in (
+            ('10.0.0.1', 'Bearer secret', 200),
+            ('127.0.0.1', '', 404),
+            ('127.0.0.1', 'Bearer wrong', 404),
+        ):
+            with self.subTest(remote_addr=remote_addr,
+                              authorization=authorization):
+                response = self.client.get(
+                    url, REMOTE_ADDR=remote_addr,
+                    HTTP_AUTHORIZATION=authorization,
+                )
+                self.assertEqual(response.status_code, status)
+
+
+class SlowQueryLogTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='noname')
+        cls.author = User.objects.create_user(username='author')
+        Follow.objects.create(user=cls.user, author=cls.author)
+        Post.objects.create(author=cls.author, text='Text')
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0)
+    def test_slow_query_record(self):
+        """В журнал попадают представление, место вызова и план."""
+        self.client.force_login(self.user)
+        with self.assertLogs('yatube.slowqueries', 'INFO') as logs:
+            self.client.get(reverse('posts:follow_index'))
+            slowqueries.flush()
+        records = [
+            json.loads(record.getMessage()) for record in logs.records
+        ]
+        feed = [
+            record for record in records
+            if 'posts_follow' in record['sql']
+            and record['sql'].startswith('SELECT')
+        ]
+        self.assertTrue(feed)
+        for record in feed:
+            self.assertEqual(record['view'], 'posts:follow_index')
+            self.assertTrue(any(
+                frame.startswith('posts/views.py:')
+                and frame.endswith(' in follow_index')
+                for frame in record['stack']
+            ))
+            self.assertIsNotNone(record['plan'])
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0)
+    def test_slow_query_hides_params(self):
+        """Значения параметров запросов в журнал не пишутся."""
+        self.client.force_login(self.user)
+        session_key = self.client.session.session_key
+        with self.assertLogs('yatube.slowqueries', 'INFO') as logs:
+            self.client.get(reverse('posts:follow_index'))
+            slowqueries.flush()
+        self.assertTrue(logs.records)
+        for record in logs.records:
+            self.assertNotIn(session_key, record.getMessage())
+            self.assertNotIn('params', json.loads(record.getMessage()))
+
+
+class TagsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_tag_feed(self):
+        """Лента тега читается порциями по курсору."""
+        posts = [
+            Post.objects.create(author=self.author, text=f'#Django {i}')
+            for i in range(SLICE_POSTS + 2)
+        ]
+        Post.objects.create(author=self.author, text='#python')
+        url = reverse('posts:tag_posts', kwargs={'name': 'django'})
+        response = self.client.get(url)
+        self.assertEqual(
+            response.context['posts'], posts[::-1][:SLICE_POSTS]
+        )
+        self.assertContains(response, f'href="{url}">#Django</a>')
+        response = self.client.get(url, {
+            'partial': 1, 'cursor': response.context['next_cursor']
+        })
+        self.assertEqual(response.context['posts'], posts[1::-1])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_edit_updates_index(self):
+        """Правка поста меняет только разошедшиеся теги и упоминания."""
+        post = Post.objects.create(
+            author=self.author, text='#one #two, привет @reader и @author'
+        )
+        self.assertEqual(
+            set(post.tag_links.values_list('tag__name', flat=True)),
+            {'one', 'two'},
+        )
+        link = post.tag_links.get(tag__name='two')
+        self.assertEqual(
+            list(Mention.objects.values_list('user', flat=True)),
+            [self.reader.pk],
+        )
+        self.author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            {'text': '#two #three'},
+        )
+        self.assertEqual(
+            set(post.tag_links.values_list('tag__name', flat=True)),
+            {'two', 'three'},
+        )
+        self.assertTrue(TaggedPost.objects.filter(pk=link.pk).exists())
+        self.assertFalse(Mention.objects.exists())
+
+    def test_mentions(self):
+        """Упомянутый видит счётчик, а после просмотра он обнуляется."""
+        post = Post.objects.create(author=self.author, text='@reader, смотри')
+        response = self.reader_client.get(reverse('posts:index'))
+        self.assertContains(response, 'badge-danger')
+        response = self.reader_client.get(reverse('posts:mentions'))
+        self.assertEqual(response.context['posts'], [post])
+        self.assertContains(
+            response,
+            f'<a href="{reverse("posts:profile", args=["reader"])}">'
+            '@reader</a>',
+        )
+        response = self.reader_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'badge-danger')
+
+
+class RevisionsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_every_edit_is_recorded(self):
+        """Каждая правка сохраняется, любая версия восстанавливается."""
+        texts = ['Первый вариант текста.']
+        post = Post.objects.create(author=self.author, text=texts[0])
+        self.assertFalse(post.revisions.exists())
+        url = reverse('posts:post_edit', kwargs={'post_id': post.pk})
+        for i in range(12):
+            texts.append(f'{texts[-1]} Правка {i}.')
+            self.author_client.post(url, {'text': texts[-1]})
+        self.assertEqual(
+            list(post.revisions.filter(
+                is_snapshot=True
+            ).values_list('number', flat=True)),
+            [1, 11],
+        )
+        for number, text in enumerate(texts, start=1):
+            with self.assertNumQueries(1):
+                self.assertEqual(text_at(post, number), text)
+        self.assertIsNone(text_at(post, len(texts) + 1))
+
+        response = self.author_client.get(
+            reverse('posts:post_history', kwargs={'post_id': post.pk})
+        )
+        self.assertEqual(len(response.context['revisions']), len(texts))
+        response = self.author_client.get(reverse(
+            'posts:post_revision',
+            kwargs={'post_id': post.pk, 'number': 5},
+        ))
+        self.assertEqual(response.context['text'], texts[4])
+
+    def test_history_is_private(self):
+        """Историю правок видит только автор."""
+        post = Post.objects.create(author=self.author, text='Текст')
+        for name, kwargs in (
+            ('posts:post_history', {'post_id': post.pk}),
+            ('posts:post_revision', {'post_id': post.pk, 'number': 1}),
+        ):
+            with self.subTest(name=name):
+                response = self.reader_client.get(reverse(name, kwargs=kwargs))
+                self.assertRedirects(response, reverse(
+                    'posts:post_detail', kwargs={'post_id': post.pk}
+                ))
@@ -0,0 +1,102 @@
+import threading
+
+from django.core.signals import request_finished
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend as BaseThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.metrics import Counter
+
+# Должны совпадать с параметрами {% thumbnail %} в includes/post.html.
+POST_GEOMETRY = '960x339'
+POST_OPTIONS = {'crop': 'center', 'upscale': True}
+
+_prefetched = threading.local()
+
+THUMBNAILS_CREATED = Counter(
+    'yatube_thumbnails_created_total',
+    'Созданные миниатюры.'
+)
+
+
+class ThumbnailBackend(BaseThumbnailBackend):
+    def get_thumbnail_name(self, file_, geometry_string, **options):
+        """Имя миниатюры без обращения к хранилищу и KV-store.
+
+        Повторяет подготовку опций из get_thumbnail(), иначе ключи
+        не совпадут с теми, что ищет тег {% thumbnail %}.
+        """
+        source = ImageFile(file_)
+        if settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return self._get_thumbnail_filename(source, geometry_string, options)
+
+    def _create_thumbnail(self, *args, **kwargs):
+        super()._create_thumbnail(*args, **kwargs)
+        THUMBNAILS_CREATED.inc()
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    """KV-store sorl с пакетной подгрузкой записей на всю страницу.
+
+    Записи сначала ищутся в памяти текущего запроса, затем в кеше
+    THUMBNAIL_CACHE и только потом в БД.
+    """
+
+    def prefetch(self, keys):
+        raw_keys = [add_prefix(key) for key in keys]
+        values = self.cache.get_many(raw_keys)
+        missing = [key for key in raw_keys if key not in values]
+        if missing:
+            found = dict(
+                KVStoreModel.objects.filter(
+                    key__in=missing
+                ).values_list('key', 'value')
+            )
+            fetched = {
+                key: found.get(key, cached_db_kvstore.EMPTY_VALUE)
+                for key in missing
+            }
+            self.cache.set_many(fetched, settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(fetched)
+        _prefetched.values = values
+
+    def _get_raw(self, key):
+        values = getattr(_prefetched, 'values', None)
+        if values and key in values:
+            value = values.pop(key)
+            if value == cached_db_kvstore.EMPTY_VALUE:
+                return None
+            return value
+        return super()._get_raw(key)
+
+
+def prefetch_thumbnails(posts):
+    """Одним запросом подгружает миниатюры для всех постов страницы."""
+    keys = []
+    for post in posts:
+        if post.image:
+            name = default.backend.get_thumbnail_name(
+                post.image, POST_GEOMETRY, **POST_OPTIONS
+            )
+            keys.append(ImageFile(name, default.storage).key)
+    if keys and hasattr(default.kvstore, 'prefetch'):
+        default.kvstore.prefetch(keys)
+
+
+def clear_prefetched(**kwargs):
+    _prefetched.values = None
+
+
+request_finished.connect(clear_prefetched)
@@ -1,47 +1,221 @@
+import json
+from http import HTTPStatus
+
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db.models import F
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
-
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.views.decorators.http import require_POST
+
+from core import pagecache
+from core.paginator import (
+    EstimatedCountPaginator, KeysetPaginator, QuerySetChain, QuerySetMerge
+)
+from core.ratelimit import ratelimit
+
+from .counters import view_counter
+from .follows import (
+    MAX_BULK_FOLLOWS, author_ids, follow_pairs, unfollow_pairs
+)
 from .forms import PostForm, CommentForm
-from .models import Post, Group, User, Follow
+from .models import (
+    ArchivedPost, FeedState, Post, Group, GroupStats, GroupSubscription,
+    PendingDeletion, Suggestion, Tag, User, Follow
+)
+from .revisions import text_at
+from .thumbnails import prefetch_thumbnails
 
 from django.conf import settings
 
 
-def paginator(request, posts_list):
-    paginator = Paginator(posts_list, settings.SLICE_POSTS)
+def deleted_authors():
+    """Авторы, поставленные в очередь на удаление: их посты скрыты."""
+    return PendingDeletion.objects.filter(
+        user__isnull=False
+    ).values('user')
+
+
+def suggestions_for(user):
+    """Сохранённые рекомендации авторов: чтение по индексу (user, rank)."""
+    if not user.is_authenticated:
+        return []
+    return Suggestion.objects.filter(user=user).select_related(
+        'author'
+    )[:settings.SUGGESTIONS_SHOWN]
+
+
+def paginator(request, posts_list, keyset=True):
+    """Страница по номеру; для лент по дате — ещё и курсор подгрузки.
+
+    С ?cursor= отдаётся порция после курсора целой страницей: по этой
+    ссылке кнопка «Показать ещё» работает и без JavaScript.
+    С keyset=False порядок posts_list сохраняется, а курсора нет.
+    """
+    keyset_paginator = KeysetPaginator(posts_list, settings.SLICE_POSTS)
+    cursor = request.GET.get('cursor')
+    if keyset and cursor:
+        posts, next_cursor = keyset_paginator.page(cursor)
+        page_obj = Paginator(posts, settings.SLICE_POSTS).page(1)
+        prefetch_thumbnails(posts)
+        page_obj.next_cursor = next_cursor
+        return page_obj
+    if keyset:
+        posts_list = keyset_paginator.ordered()
+    paginator = EstimatedCountPaginator(posts_list, settings.SLICE_POSTS)
     page_number = request.GET.get('page', 1)
     page_obj = paginator.get_page(page_number)
+    page_obj.object_list = list(page_obj.object_list)
+    prefetch_thumbnails(page_obj.object_list)
+    page_obj.next_cursor = None
+    if keyset and page_obj.has_next() and page_obj.object_list:
+        page_obj.next_cursor = keyset_paginator.cursor_for(
+            page_obj.object_list[-1]
+        )
     return page_obj
 
 
+def feed_fragment(request, posts_list, **card_options):
+    """Только карточки постов после курсора, без base.html.
+
+    Отдаётся на ?partial=1 для подгрузки ленты; context processors
+    и шапка страницы не отрисовываются.
+    """
+    posts, next_cursor = KeysetPaginator(
+        posts_list, settings.SLICE_POSTS
+    ).page(request.GET.get('cursor'))
+    return render_fragment(posts, next_cursor, **card_options)
+
+
+def render_fragment(posts, next_cursor, **card_options):
+    prefetch_thumbnails(posts)
+    context = {
+        'posts': posts,
+        'next_cursor': next_cursor,
+        **card_options,
+    }
+    return HttpResponse(
+        render_to_string(
+            'posts/includes/feed_fragment.html', context,
+            using=settings.POSTS_TEMPLATE_ENGINE
+        )
+    )
+
+
+def linked_posts(request, links):
+    """Порция постов по строкам обратного индекса (теги, упоминания).
+
+    Курсор идёт по индексу (владелец, -pub_date, -id) таблицы связей,
+    посты затем читаются по первичному ключу.
+    """
+    links, next_cursor = KeysetPaginator(
+        links.exclude(post__author__in=deleted_authors()),
+        settings.SLICE_POSTS
+    ).page(request.GET.get('cursor'))
+    posts = Post.objects.select_related(
+        'author', 'group', 'last_comment__author'
+    ).in_bulk([link.post_id for link in links])
+    return [posts[link.post_id] for link in links], next_cursor
+
+
 def index(request):
     """Главная страница"""
+    pagecache.add_tags('posts.post')
     template = 'posts/index.html'
-    posts_list = Post.objects.select_related('author', 'group')
+    posts_list = Post.objects.select_related(
+        'author', 'group', 'last_comment__author'
+    ).exclude(author__in=deleted_authors())
+    if request.GET.get('partial'):
+        return feed_fragment(request, posts_list, author=True, group_list=True)
     page_obj = paginator(request, posts_list)
     context = {
         'page_obj': page_obj,
     }
-    return render(request, template, context)
+    return render(
+        request, template, context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
+
+
+def trending(request):
+    """Популярные посты"""
+    pagecache.add_tags('posts.post')
+    template = 'posts/trending.html'
+    posts_list = Post.objects.select_related(
+        'author', 'group', 'last_comment__author'
+    ).filter(
+        trending__isnull=False
+    ).exclude(
+        author__in=deleted_authors()
+    ).order_by('-trending__score')
+    page_obj = paginator(request, posts_list, keyset=False)
+    context = {
+        'page_obj': page_obj,
+        'trending': True,
+    }
+    return render(
+        request, template, context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
+
+
+def group_index(request):
+    """Каталог групп, отсортированный по активности"""
+    pagecache.add_tags('posts.group')
+    template = 'posts/group_index.html'
+    stats_list = GroupStats.objects.select_related('group').filter(
+        group__pending_deletion__isnull=True
+    )
+    page_obj = Paginator(stats_list, settings.SLICE_POSTS).get_page(
+        request.GET.get('page', 1)
+    )
+    context = {
+        'page_obj': page_obj,
+    }
+    return render(
+        request, template, context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
 
 
 def group_posts(request, slug):
     """Группы постов"""
     template = 'posts/group_list.html'
-    group = get_object_or_404(Group, slug=slug)
-    posts_list = group.posts.select_related('author', 'group')
+    group = get_object_or_404(
+        Group, slug=slug, pending_deletion__isnull=True
+    )
+    posts_list = group.posts.select_related(
+        'author', 'group', 'last_comment__author'
+    ).exclude(author__in=deleted_authors())
+    if request.GET.get('partial'):
+        return feed_fragment(request, posts_list, author=True)
     page_obj = paginator(request, posts_list)
     context = {
         'group': group,
         'page_obj': page_obj,
+        'subscribed': (
+            request.user.is_authenticated
+            and group.subscribers.filter(user=request.user).exists()
+        ),
     }
-    return render(request, template, context)
+    return render(
+        request, template, context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
 
 
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    posts_list = user.posts.select_related('group')
+    user = get_object_or_404(
+        User, username=username, pending_deletion__isnull=True
+    )
+    posts_list = QuerySetChain(
+        user.posts.select_related('group', 'last_comment__author'),
+        user.archived_posts.select_related('group'),
+    )
+    if request.GET.get('partial'):
+        return feed_fragment(request, posts_list, group_list=True)
 
     following = (request.user.is_authenticated
                  and user.following.filter(author=user, user=request.user
@@ -52,26 +226,45 @@ def profile(request, username):
         'page_obj': page_obj,
         'posts_total': page_obj.paginator.count,
         'following': following,
+        'suggestions': suggestions_for(request.user),
     }
-    return render(request, 'posts/profile.html', context)
+    return render(
+        request, 'posts/profile.html', context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
 
 
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    posts_total = post.author.posts.count()
-
-    comments = post.comments.all()
+    post = Post.objects.filter(pk=post_id).first()
+    is_archived = post is None
+    if is_archived:
+        post = get_object_or_404(ArchivedPost, pk=post_id)
+    if deleted_authors().filter(user=post.author_id).exists():
+        raise Http404
+    if not is_archived:
+        view_counter.add(post.pk)
+    posts_total = (post.author.posts.count()
+                   + post.author.archived_posts.count())
+
+    comments = post.comments.select_related('author').exclude(
+        author__in=deleted_authors()
+    )
 
     context = {
         'post': post,
+        'is_archived': is_archived,
         'posts_total': posts_total,
         'form': CommentForm(),
         'comments': comments,
     }
-    return render(request, 'posts/post_detail.html', context)
+    return render(
+        request, 'posts/post_detail.html', context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
 
 
 @login_required
+@ratelimit('post_create')
 def post_create(request):
 
     form = PostForm(
@@ -91,7 +284,10 @@ def post_create(request):
         'form': form,
         'is_edit': False,
     }
-    return render(request, 'posts/create_post.html', context)
+    return render(
+        request, 'posts/create_post.html', context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
 
 
 @login_required
@@ -120,10 +316,57 @@ def post_edit(request, post_id):
         'form': form,
         'is_edit': True,
     }
-    return render(request, 'posts/create_post.html', context)
+    return render(
+        request, 'posts/create_post.html', context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
+
+
+def post_or_archived(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None:
+        post = get_object_or_404(ArchivedPost, pk=post_id)
+    return post
 
 
 @login_required
+def post_history(request, post_id):
+    """История правок поста, в том числе архивного; видна только автору."""
+    post = post_or_archived(post_id)
+    if request.user != post.author:
+        return redirect('posts:post_detail', post_id)
+    context = {
+        'post': post,
+        'revisions': post.revisions.defer('data').order_by('-number'),
+    }
+    return render(
+        request, 'posts/post_history.html', context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
+
+
+@login_required
+def post_revision(request, post_id, number):
+    """Текст поста в версии number."""
+    post = post_or_archived(post_id)
+    if request.user != post.author:
+        return redirect('posts:post_detail', post_id)
+    text = text_at(post, number)
+    if text is None:
+        raise Http404
+    context = {
+        'post': post,
+        'number': number,
+        'text': text,
+    }
+    return render(
+        request, 'posts/post_revision.html', context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
+
+
+@login_required
+@ratelimit('add_comment')
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -135,28 +378,210 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def follow_feed(user):
+    """Лента подписок: посты авторов и групп, на которые подписан user.
+
+    Пока источников немного, у каждого автора и каждой группы своя
+    лента, которая читается по индексу (author|group, -pub_date) без
+    сортировки; все ленты идут в БД одним запросом UNION ALL. При
+    большом числе подписок запрос разросся бы, и авторы и группы
+    читаются двумя лентами с IN.
+    """
+    posts = Post.objects.select_related(
+        'author', 'group', 'last_comment__author'
+    )
+    deleted = set(
+        deleted_authors().order_by().values_list('user', flat=True)
+    )
+    author_ids = [
+        author_id for author_id in Follow.objects.filter(
+            user=user
+        ).values_list('author_id', flat=True)
+        if author_id not in deleted
+    ]
+    group_ids = list(
+        GroupSubscription.objects.filter(
+            user=user, group__pending_deletion__isnull=True
+        ).values_list('group_id', flat=True)
+    )
+    if len(author_ids) + len(group_ids) <= settings.FOLLOW_FEED_MAX_STREAMS:
+        streams = [posts.filter(author_id=pk) for pk in author_ids] + [
+            posts.filter(group_id=pk).exclude(author__in=deleted)
+            for pk in group_ids
+        ]
+    else:
+        streams = [
+            posts.filter(author__in=author_ids),
+            posts.filter(group__in=group_ids).exclude(author__in=deleted),
+        ]
+    return QuerySetMerge(*streams, base=posts)
+
+
 @login_required
 def follow_index(request):
-    user = get_object_or_404(User, username=request.user)
-    posts = Post.objects.filter(author__following__user=user).all()
-    page_obj = paginator(request, posts)
+    cursor = request.GET.get('cursor')
+    posts, next_cursor = KeysetPaginator(
+        follow_feed(request.user), settings.SLICE_POSTS
+    ).page(cursor)
+    if request.GET.get('partial'):
+        return render_fragment(
+            posts, next_cursor, author=True, group_list=True
+        )
+    prefetch_thumbnails(posts)
+    state, _ = FeedState.objects.get_or_create(user=request.user)
+    if not cursor:
+        # Вычитается прочитанное значение, а не обнуляется: посты,
+        # опубликованные во время отрисовки, останутся непрочитанными.
+        FeedState.objects.filter(pk=state.pk).update(
+            last_seen=timezone.now(),
+            unread_count=F('unread_count') - state.unread_count,
+        )
+    first_read = None
+    if state.unread_count:
+        first_read = next((
+            index for index, post in enumerate(posts)
+            if post.pub_date <= state.last_seen
+        ), None)
     context = {
-        'page_obj': page_obj,
+        'posts': posts,
+        'next_cursor': next_cursor,
+        'unread_count': state.unread_count,
+        'first_read': first_read,
+        'suggestions': suggestions_for(request.user),
     }
-    return render(request, 'posts/follow.html', context)
+    return render(
+        request, 'posts/follow.html', context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
+
+
+def wants_json(request):
+    return 'application/json' in request.META.get('HTTP_ACCEPT', '')
 
 
 @login_required
+@ratelimit('profile_follow', methods=None)
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    follow = Follow.objects.filter(user=request.user, author=author).exists()
-    if not follow and username != request.user.username:
-        Follow.objects.create(user=request.user, author=author)
+    follow_pairs([(request.user.pk, author.pk)])
+    if wants_json(request):
+        return JsonResponse({'following': author != request.user})
     return redirect('posts:follow_index')
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    unfollow_pairs([(request.user.pk, author.pk)])
+    if wants_json(request):
+        return JsonResponse({'following': False})
     return redirect('posts:follow_index')
+
+
+def username_list(data, key):
+    """Поле key JSON-запроса; ValueError, если это не список строк.
+
+    Строка тоже итерируема, поэтому тип проверяется явно: иначе
+    "abc" превратилась бы в подписку на «a», «b» и «c».
+    """
+    value = data.get(key, [])
+    if not isinstance(value, list) or not all(
+        isinstance(item, str) for item in value
+    ):
+        raise ValueError(f'{key}: ожидается список строк')
+    return value
+
+
+@login_required
+@require_POST
+@ratelimit('follow_bulk')
+def follow_bulk(request):
+    """Подписка и отписка от многих авторов одним JSON-запросом.
+
+    Тело запроса: {"follow": [username, ...], "unfollow": [username, ...]}.
+    """
+    try:
+        data = json.loads(request.body)
+        follow = username_list(data, 'follow')
+        unfollow = username_list(data, 'unfollow')
+    except (ValueError, AttributeError):
+        return JsonResponse(
+            {'error': 'Ожидается JSON со списками имён follow и unfollow.'},
+            status=HTTPStatus.BAD_REQUEST
+        )
+    if len(follow) + len(unfollow) > MAX_BULK_FOLLOWS:
+        return JsonResponse(
+            {'error': f'Не больше {MAX_BULK_FOLLOWS} авторов за запрос.'},
+            status=HTTPStatus.BAD_REQUEST
+        )
+    user_id = request.user.pk
+    followed = follow_pairs(
+        (user_id, author_id) for author_id in author_ids(follow)
+    )
+    unfollowed = unfollow_pairs(
+        (user_id, author_id) for author_id in author_ids(unfollow)
+    )
+    return JsonResponse({'followed': followed, 'unfollowed': unfollowed})
+
+
+def tag_posts(request, name):
+    """Посты с хештегом"""
+    pagecache.add_tags('posts.post')
+    tag = get_object_or_404(Tag, name=name.lower())
+    posts, next_cursor = linked_posts(
+        request, tag.links.only('post_id', 'pub_date')
+    )
+    if request.GET.get('partial'):
+        return render_fragment(
+            posts, next_cursor, author=True, group_list=True
+        )
+    prefetch_thumbnails(posts)
+    context = {
+        'tag': tag,
+        'posts': posts,
+        'next_cursor': next_cursor,
+    }
+    return render(
+        request, 'posts/tag_list.html', context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
+
+
+@login_required
+def mentions(request):
+    """Посты, в которых упомянут пользователь"""
+    posts, next_cursor = linked_posts(
+        request, request.user.mentions.only('post_id', 'pub_date')
+    )
+    if request.GET.get('partial'):
+        return render_fragment(
+            posts, next_cursor, author=True, group_list=True
+        )
+    request.user.mentions.filter(is_seen=False).update(is_seen=True)
+    prefetch_thumbnails(posts)
+    context = {
+        'posts': posts,
+        'next_cursor': next_cursor,
+    }
+    return render(
+        request, 'posts/mentions.html', context,
+        using=settings.POSTS_TEMPLATE_ENGINE
+    )
+
+
+@login_required
+@ratelimit('profile_follow', methods=None)
+def group_subscribe(request, slug):
+    group = get_object_or_404(
+        Group, slug=slug, pending_deletion__isnull=True
+    )
+    GroupSubscription.objects.get_or_create(user=request.user, group=group)
+    return redirect('posts:group_list', slug)
+
+
+@login_required
+def group_unsubscribe(request, slug):
+    GroupSubscription.objects.filter(
+        user=request.user, group__slug=slug
+    ).delete()
+    return redirect('posts:group_list', slug)
@@ -0,0 +1,112 @@
+import re
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+from django.urls import reverse
+from sorl.thumbnail import get_thumbnail
+
+from .models import GroupStats, Post, PostScore
+from .thumbnails import POST_GEOMETRY, POST_OPTIONS
+
+ACCESS_LOG_REQUEST = re.compile(r'"GET (\S+) HTTP/[\d.]+" (\d{3})')
+
+
+def paths_from_log(lines, limit):
+    """Самые частые пути из журнала доступа.
+
+    Понимает строки combined-формата nginx и строки «путь число»
+    с уже посчитанной статистикой. Учитываются только успешные GET.
+    """
+    hits = Counter()
+    for line in lines:
+        match = ACCESS_LOG_REQUEST.search(line)
+        if match:
+            if match.group(2) == '200':
+                hits[match.group(1)] += 1
+            continue
+        parts = line.split()
+        if len(parts) == 2 and parts[0].startswith('/'):
+            try:
+                hits[parts[0]] += int(parts[1])
+            except ValueError:
+                pass
+    return [path for path, _ in hits.most_common(limit)]
+
+
+def default_paths(limit):
+    """Главные ленты, самые активные группы и авторы популярных постов."""
+    paths = [
+        reverse('posts:index'),
+        reverse('posts:trending'),
+        reverse('posts:group_index'),
+    ]
+    slugs = GroupStats.objects.filter(
+        group__pending_deletion__isnull=True
+    ).values_list('group__slug', flat=True)[:limit]
+    paths.extend(
+        reverse('posts:group_list', kwargs={'slug': slug}) for slug in slugs
+    )
+    authors = PostScore.objects.order_by('-score').values_list(
+        'post__author__username', flat=True
+    )[:limit * 5]
+    paths.extend(
+        reverse('posts:profile', kwargs={'username': username})
+        for username in list(dict.fromkeys(authors))[:limit]
+    )
+    return paths
+
+
+def thumbnail_sources(limit):
+    """Картинки популярных и свежих постов."""
+    trending = Post.objects.exclude(image='').filter(
+        trending__isnull=False
+    ).order_by('-trending__score').values_list('image', flat=True)[:limit]
+    latest = Post.objects.exclude(image='').order_by(
+        '-pub_date'
+    ).values_list('image', flat=True)[:limit]
+    return list(dict.fromkeys([*trending, *latest]))
+
+
+def fetch(url, timeout):
+    """Запрашивает страницу без cookie; возвращает (url, статус, секунды)."""
+    started = time.monotonic()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        status = error.code
+    except (urllib.error.URLError, OSError) as error:
+        status = str(error)
+    return url, status, time.monotonic() - started
+
+
+def make_thumbnail(image):
+    started = time.monotonic()
+    try:
+        get_thumbnail(image, POST_GEOMETRY, **POST_OPTIONS)
+        status = 'ok'
+    except Exception as error:
+        status = str(error)
+    finally:
+        connections.close_all()
+    return image, status, time.monotonic() - started
+
+
+def warm(base_url, paths, images, workers=8, timeout=30):
+    """Параллельно создаёт миниатюры, затем запрашивает страницы.
+
+    Миниатюры делаются в этом процессе (они общие для всех через
+    хранилище и KV-store), страницы — через HTTP, чтобы заполнился
+    кеш именно процессов сервера. Возвращает результаты по мере
+    готовности: (адрес или картинка, статус, секунды).
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(make_thumbnail, images)
+        yield from executor.map(
+            lambda path: fetch(base_url.rstrip('/') + path, timeout), paths
+        )
@@ -0,0 +1,29 @@
+// Подгрузка следующей порции постов: кнопка ведёт на целую страницу
+// с курсором, а скрипт добавляет ?partial=1, и ответ содержит только
+// карточки и новую кнопку, которая заменяет нажатую.
+document.addEventListener('click', function (event) {
+  var button = event.target.closest('.js-load-more');
+  if (!button) {
+    return;
+  }
+  event.preventDefault();
+  button.classList.add('disabled');
+  var url = new URL(button.href);
+  url.searchParams.set('partial', '1');
+  fetch(url, {credentials: 'same-origin'})
+    .then(function (response) {
+      if (!response.ok) {
+        throw new Error(response.status);
+      }
+      return response.text();
+    })
+    .then(function (html) {
+      button.insertAdjacentHTML('beforebegin', html);
+      button.remove();
+      document.querySelectorAll('nav[aria-label="Page navigation"]')
+        .forEach(function (nav) { nav.remove(); });
+    })
+    .catch(function () {
+      button.classList.remove('disabled');
+    });
+});
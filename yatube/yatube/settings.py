@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -50,7 +51,10 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.slowqueries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.pagecache.PageCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -74,11 +78,30 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 # Добавлен контекст-процессор
                 'core.context_processors.year.year',
+                'core.context_processors.mentions.mentions',
             ],
         },
     },
 ]
 
+# Шаблоны posts на Jinja2 (каталог jinja2/).
+TEMPLATES.append({
+    'BACKEND': 'django.template.backends.jinja2.Jinja2',
+    'DIRS': [os.path.join(BASE_DIR, 'jinja2')],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        'environment': 'core.jinja2.environment',
+        'context_processors': [
+            'django.contrib.auth.context_processors.auth',
+            'core.context_processors.year.year',
+            'core.context_processors.mentions.mentions',
+        ],
+    },
+})
+
+# Каким движком отрисовываются страницы posts: 'django' или 'jinja2'.
+POSTS_TEMPLATE_ENGINE = os.getenv('POSTS_TEMPLATE_ENGINE', 'django')
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
@@ -149,10 +172,128 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 MEDIA_URL = '/media/'
 #MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+# Кеш по умолчанию хранит кеш страниц и счётчики лимитов запросов,
+# поэтому должен быть общим для всех процессов сервера: задайте
+# MEMCACHED_LOCATION. Без него используется LocMemCache, у каждого
+# процесса свой, и так можно запускать только один процесс.
 CACHES = {
     'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.getenv('MEMCACHED_LOCATION'),
+    } if os.getenv('MEMCACHED_LOCATION') else {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    # Фрагменты {% cache %}; попадания видны в /metrics.
+    'template_fragments': {
+        'BACKEND': 'core.metrics.MeteredLocMemCache',
+        'LOCATION': 'template_fragments',
+    },
+    # Метаданные миниатюр sorl: после прогрева KV-store не ходит в БД.
+    'thumbnails': {
+        'BACKEND': 'core.metrics.MeteredLocMemCache',
+        'LOCATION': 'thumbnails',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
 
+THUMBNAIL_BACKEND = 'posts.thumbnails.ThumbnailBackend'
+THUMBNAIL_KVSTORE = 'posts.thumbnails.KVStore'
+THUMBNAIL_CACHE = 'thumbnails'
+
 SLICE_POSTS = 10
+
+# Выше этого числа строк пагинатор показывает оценку планировщика
+# вместо точного COUNT(*).
+PAGINATOR_COUNT_THRESHOLD = 10000
+
+# Лента «Популярное»: учитываются события за окно, вклад события
+# уменьшается вдвое за период полураспада (секунды).
+TRENDING_WINDOW = 3 * 24 * 60 * 60
+TRENDING_HALF_LIFE = 6 * 60 * 60
+
+# Посты старше этого числа дней переносятся в архивные таблицы.
+ARCHIVE_AFTER_DAYS = 365
+
+# Лимиты на запросы, изменяющие данные, отдельно на пользователя и на
+# IP-адрес: (ёмкость корзины токенов, секунд на её полное пополнение).
+# Корзины хранятся в кеше RATELIMIT_CACHE; общими для процессов они
+# будут только с memcached.
+RATELIMIT_CACHE = 'default'
+RATELIMITS = {
+    'post_create': {'user': (10, 60), 'ip': (30, 60)},
+    'add_comment': {'user': (30, 60), 'ip': (100, 60)},
+    'profile_follow': {'user': (60, 60), 'ip': (200, 60)},
+    'follow_bulk': {'user': (10, 60), 'ip': (30, 60)},
+    'signup': {'ip': (5, 60 * 60)},
+}
+
+# Кеш целых страниц для анонимных посетителей, см. core.pagecache.
+PAGECACHE_CACHE = 'default'
+PAGECACHE_TIMEOUT = 5 * 60
+
+# Сколько рекомендованных авторов показывать в профиле и ленте подписок.
+SUGGESTIONS_SHOWN = 5
+
+# Просмотры постов копятся в памяти процесса и записываются в БД не чаще
+# раза в указанное число секунд или при таком числе постов в буфере.
+VIEW_COUNTER_FLUSH_INTERVAL = 10
+VIEW_COUNTER_MAX_PENDING = 1000
+
+# Метрики Prometheus (/metrics). Процессы одного сервера складывают свои
+# значения в общий каталог METRICS_DIR; без него видны метрики только
+# процесса, ответившего на запрос.
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
+# Если задан METRICS_TOKEN, /metrics отдаётся только с заголовком
+# «Authorization: Bearer <токен>», с любого адреса. Без токена доступ
+# ограничен METRICS_ALLOWED_IPS по REMOTE_ADDR: это годится, только если
+# сервер открыт напрямую. За nginx все запросы приходят с 127.0.0.1,
+# и тогда нужен токен.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+METRICS_ALLOWED_IPS = tuple(
+    os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+)
+
+# Журнал медленных SQL-запросов (JSONL с ротацией), см. core.slowqueries.
+# Пустой SLOW_QUERY_THRESHOLD выключает замер.
+SLOW_QUERY_THRESHOLD = os.getenv('SLOW_QUERY_THRESHOLD', '0.5')
+SLOW_QUERY_THRESHOLD = (
+    float(SLOW_QUERY_THRESHOLD) if SLOW_QUERY_THRESHOLD else None
+)
+SLOW_QUERY_LOG = os.getenv(
+    'SLOW_QUERY_LOG', os.path.join(BASE_DIR, 'slow_queries.jsonl')
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'encoding': 'utf-8',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'yatube.slowqueries': {
+            'handlers': ['slow_queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Пока подписок на авторов и группы не больше этого числа, лента подписок
+# сливается из отдельных лент по индексу (один запрос UNION ALL), без
+# сортировки всей выборки в БД.
+FOLLOW_FEED_MAX_STREAMS = 50